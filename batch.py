@@ -0,0 +1,115 @@
+"""
+Packing and unpacking for the batch endpoint: the quotations inside the
+uploads (plain .xlsx files or .zip archives of them), and the zip that goes
+back with one output per quotation and a combined failure report.
+"""
+import io
+import os
+import zipfile
+import zlib
+
+from errors import DetailError
+from output_formats import iter_csv
+
+# Quotations accepted in one batch, counting the files inside archives
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "200"))
+
+# Largest quotation accepted once decompressed, and the cap for the batch
+BATCH_MAX_FILE_BYTES  = int(os.getenv("BATCH_MAX_FILE_BYTES", str(50 * 1024 * 1024)))
+BATCH_MAX_TOTAL_BYTES = int(os.getenv("BATCH_MAX_TOTAL_BYTES", str(500 * 1024 * 1024)))
+
+FAILURE_REPORT_NAME = "failures.csv"
+FAILURE_COLUMNS     = ["File", "Row", "Model", "Cabinet Position", "Reason"]
+
+
+class BatchError(DetailError):
+    pass
+
+
+def _is_quotation(name: str) -> bool:
+    base = os.path.basename(name)
+    # Skip Excel lock files and the resource forks macOS adds to archives
+    return (base.lower().endswith(".xlsx") and not base.startswith("~$")
+            and not name.startswith("__MACOSX/"))
+
+
+def _read_member(archive, info, filename: str) -> bytes:
+    too_big = BatchError(f"{filename}: {info.filename} is larger than {BATCH_MAX_FILE_BYTES} bytes "
+                         "uncompressed")
+    if info.file_size > BATCH_MAX_FILE_BYTES:
+        raise too_big
+    # The declared size can lie, so the read itself is bounded too
+    with archive.open(info) as member:
+        data = member.read(BATCH_MAX_FILE_BYTES + 1)
+    if len(data) > BATCH_MAX_FILE_BYTES:
+        raise too_big
+    return data
+
+
+def unpack_uploads(uploads) -> list:
+    """
+    (name, contents) for every quotation in `uploads`, a list of
+    (filename, bytes) where each file is an .xlsx or a .zip of them.
+    """
+    quotations = []
+    total      = 0
+
+    def check_limits(count: int, size: int):
+        if count > BATCH_MAX_FILES:
+            raise BatchError(f"A batch holds at most {BATCH_MAX_FILES} quotations")
+        if size > BATCH_MAX_TOTAL_BYTES:
+            raise BatchError(f"A batch holds at most {BATCH_MAX_TOTAL_BYTES} bytes uncompressed")
+
+    for filename, contents in uploads:
+        lower = filename.lower()
+        if lower.endswith(".xlsx"):
+            quotations.append((os.path.basename(filename), contents))
+            total += len(contents)
+            check_limits(len(quotations), total)
+        elif lower.endswith(".zip"):
+            try:
+                with zipfile.ZipFile(io.BytesIO(contents)) as archive:
+                    members = [info for info in archive.infolist()
+                               if not info.is_dir() and _is_quotation(info.filename)]
+                    # Checked on the declared sizes before anything is inflated,
+                    # then again on what each bounded read actually returned
+                    check_limits(len(quotations) + len(members),
+                                 total + sum(info.file_size for info in members))
+                    for info in members:
+                        data   = _read_member(archive, info, filename)
+                        total += len(data)
+                        quotations.append((os.path.basename(info.filename), data))
+                        check_limits(len(quotations), total)
+            except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError, zlib.error):
+                # zlib.error: a member whose compressed data is corrupt
+                raise BatchError(f"{filename} is not a valid zip archive")
+        else:
+            raise BatchError(f"{filename}: upload .xlsx files or a .zip of them")
+    if not quotations:
+        raise BatchError("No .xlsx files in the upload")
+    return quotations
+
+
+def _unique_name(name: str, taken: set) -> str:
+    stem, ext = os.path.splitext(name)
+    candidate, n = name, 1
+    while candidate.lower() in taken:
+        n += 1
+        candidate = f"{stem} ({n}){ext}"
+    taken.add(candidate.lower())
+    return candidate
+
+
+def pack_outputs(outputs, failures) -> bytes:
+    """
+    The batch response archive. `outputs` is (source name, extension, bytes)
+    per processed quotation; `failures` rows follow FAILURE_COLUMNS.
+    """
+    buffer = io.BytesIO()
+    taken  = {FAILURE_REPORT_NAME}
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, extension, data in outputs:
+            stem = os.path.splitext(name)[0]
+            archive.writestr(_unique_name(f"{stem}_processed.{extension}", taken), data)
+        archive.writestr(FAILURE_REPORT_NAME, "".join(iter_csv(FAILURE_COLUMNS, failures)))
+    return buffer.getvalue()
@@ -0,0 +1,239 @@
+"""
+Bulk refresh of the catalogue tables from a CSV or xlsx file.
+
+    python catalogue_loader.py colorcode colours.xlsx
+    python catalogue_loader.py cabinets cabinets.csv
+
+The file replaces the whole table. Its first row names the columns:
+
+    colorcode   colour_name, colour_code
+    code_raw    infurnia_code, odoo_code
+    cabinets    cabinet_code, bom_line_1, bom_line_2, ...   (any number of
+                bom_line_N columns; bom_line_N becomes BOM ordinal N)
+
+Rows are validated in Python, streamed with COPY into temporary staging
+tables, and moved into place with DELETE + INSERT ... SELECT in one
+transaction that also bumps `catalogue_version`. Readers keep seeing the
+old catalogue until that transaction commits and the complete new one
+after — never a half-loaded table. Needs migrations 1-3 (see migrations.py).
+"""
+import argparse
+import csv
+import io
+import re
+import sys
+import time
+import zipfile
+
+import openpyxl
+import psycopg2
+from sqlalchemy import text
+
+from database import engine
+from errors import DetailError
+
+_BOM_COLUMN_RE = re.compile(r"bom_line_(\d+)$")
+
+# Key column first; the key must be present and unique
+TABLE_COLUMNS = {
+    "colorcode": ("colour_name", "colour_code"),
+    "code_raw":  ("infurnia_code", "odoo_code"),
+    "cabinets":  ("cabinet_code",),
+}
+
+
+class CatalogueError(DetailError):
+    pass
+
+
+# ── Reading ───────────────────────────────────────────────────────────────────
+
+def _cell_text(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # codes typed as numbers in Excel
+    value = str(value).strip()
+    return value or None
+
+
+def read_rows(filename: str, contents: bytes) -> tuple:
+    """(header, rows) from a CSV or xlsx file; header names lower-cased, cells stripped text or None."""
+    if filename.lower().endswith(".xlsx"):
+        try:
+            workbook = openpyxl.load_workbook(io.BytesIO(contents), read_only=True, data_only=True)
+        except (zipfile.BadZipFile, OSError, KeyError, ValueError) as e:
+            raise CatalogueError(f"Unable to read Excel file: {e}")
+        try:
+            rows = [[_cell_text(v) for v in row] for row in workbook.worksheets[0].iter_rows(values_only=True)]
+        finally:
+            workbook.close()
+    elif filename.lower().endswith(".csv"):
+        try:
+            decoded = contents.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise CatalogueError("CSV files must be UTF-8")
+        rows = [[_cell_text(v) for v in row] for row in csv.reader(io.StringIO(decoded))]
+    else:
+        raise CatalogueError("Upload a .csv or .xlsx file")
+
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        raise CatalogueError("The file is empty")
+    header = [(name or "").lower() for name in rows[0]]
+    return header, rows[1:]
+
+
+def parse_table(table: str, header: list, rows: list) -> dict:
+    """
+    Validated rows for `table`: {"rows": [...]} in the table's column order,
+    plus for cabinets {"bom": [(cabinet_code, ordinal, product_code), ...]}.
+    """
+    if table not in TABLE_COLUMNS:
+        raise CatalogueError(f"Unknown catalogue table {table!r}; expected one of: {', '.join(TABLE_COLUMNS)}")
+    columns = TABLE_COLUMNS[table]
+    missing = [name for name in columns if name not in header]
+    if missing:
+        raise CatalogueError(f"Missing columns: {', '.join(missing)}")
+    positions = [header.index(name) for name in columns]
+    bom_positions = sorted(
+        (int(m.group(1)), i) for i, name in enumerate(header)
+        if table == "cabinets" and (m := _BOM_COLUMN_RE.match(name))
+    )
+
+    parsed, bom, seen, problems = [], [], set(), []
+    for line_no, row in enumerate(rows, start=2):
+        row = row + [None] * (len(header) - len(row))
+        values = tuple(row[i] for i in positions)
+        key = values[0]
+        if key is None:
+            problems.append(f"row {line_no}: {columns[0]} is empty")
+            continue
+        if key in seen:
+            problems.append(f"row {line_no}: duplicate {columns[0]} {key!r}")
+            continue
+        seen.add(key)
+        parsed.append(values)
+        for ordinal, i in bom_positions:
+            if row[i] is not None:
+                bom.append((key, ordinal, row[i]))
+
+    if problems:
+        more = f" and {len(problems) - 20} more" if len(problems) > 20 else ""
+        raise CatalogueError("; ".join(problems[:20]) + more)
+    if not parsed:
+        raise CatalogueError("No rows to load")
+    return {"rows": parsed, "bom": bom}
+
+
+# ── Loading ───────────────────────────────────────────────────────────────────
+
+def _copy(cursor, staging: str, columns, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)   # None -> empty unquoted field -> NULL
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {staging} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def _sync_id_sequence(cursor, table: str):
+    # Rows get ids 1..n from file order; keep any id sequence past them
+    cursor.execute(
+        f"SELECT setval(seq, (SELECT COALESCE(MAX(id), 0) + 1 FROM {table}), false) "
+        f"FROM (SELECT pg_get_serial_sequence('{table}', 'id') AS seq) s WHERE seq IS NOT NULL"
+    )
+
+
+def _replace(cursor, table: str, data: dict):
+    columns = TABLE_COLUMNS[table]
+    cursor.execute(
+        f"CREATE TEMP TABLE staging_{table} (n serial, {', '.join(f'{c} text' for c in columns)}) "
+        "ON COMMIT DROP"
+    )
+    _copy(cursor, f"staging_{table}", columns, data["rows"])
+
+    if table == "code_raw":
+        cursor.execute("DELETE FROM code_raw")
+        cursor.execute("INSERT INTO code_raw (infurnia_code, odoo_code) "
+                       "SELECT infurnia_code, odoo_code FROM staging_code_raw")
+    elif table == "colorcode":
+        cursor.execute("DELETE FROM colorcode")
+        cursor.execute("INSERT INTO colorcode (id, colour_name, colour_code) "
+                       "SELECT n, colour_name, colour_code FROM staging_colorcode")
+        _sync_id_sequence(cursor, "colorcode")
+    else:
+        cursor.execute("CREATE TEMP TABLE staging_cabinet_bom "
+                       "(cabinet_code text, ordinal integer, product_code text) ON COMMIT DROP")
+        _copy(cursor, "staging_cabinet_bom", ("cabinet_code", "ordinal", "product_code"), data["bom"])
+        cursor.execute("DELETE FROM cabinet_bom")
+        cursor.execute("DELETE FROM cabinets")
+        cursor.execute("INSERT INTO cabinets (id, cabinet_code) SELECT n, cabinet_code FROM staging_cabinets")
+        cursor.execute(
+            "INSERT INTO cabinet_bom (cabinet_id, ordinal, product_code) "
+            "SELECT c.n, b.ordinal, b.product_code "
+            "FROM staging_cabinet_bom b JOIN staging_cabinets c USING (cabinet_code)"
+        )
+        _sync_id_sequence(cursor, "cabinets")
+
+    cursor.execute("UPDATE catalogue_version SET version = version + 1, updated_at = now() "
+                   "WHERE id = 1 RETURNING version")
+    row = cursor.fetchone()
+    if row is None:
+        raise CatalogueError("catalogue_version is empty; run migrations.py first")
+    return row[0]
+
+
+def load_catalogue(table: str, filename: str, contents: bytes, bind=engine) -> dict:
+    """Replace `table` with the rows of a CSV or xlsx file; returns what was loaded."""
+    started = time.perf_counter()
+    data    = parse_table(table, *read_rows(filename, contents))
+
+    connection = bind.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            version = _replace(cursor, table, data)
+        connection.commit()
+    except psycopg2.Error as e:
+        connection.rollback()
+        raise CatalogueError(f"Loading {table} failed: {e}".strip())
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    result = {
+        "table":   table,
+        "rows":    len(data["rows"]),
+        "version": version,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    if table == "cabinets":
+        result["bom_lines"] = len(data["bom"])
+    print(f"Loaded catalogue table {table}: {result}")
+    return result
+
+
+def current_version(bind=engine):
+    """(version, updated_at) of the catalogue."""
+    with bind.connect() as conn:
+        return conn.execute(text("SELECT version, updated_at FROM catalogue_version WHERE id = 1")).first()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replace a catalogue table from a CSV or xlsx file.")
+    parser.add_argument("table", choices=list(TABLE_COLUMNS))
+    parser.add_argument("file")
+    args = parser.parse_args(argv)
+
+    with open(args.file, "rb") as f:
+        contents = f.read()
+    try:
+        load_catalogue(args.table, args.file, contents)
+    except CatalogueError as e:
+        print(f"Load failed: {e.detail}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
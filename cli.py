@@ -0,0 +1,139 @@
+"""
+Convert a directory of Infurnia quotation exports without the web server:
+
+    python cli.py exports/ --workers 8 --format xlsx
+
+Each <name>.xlsx gets a <name>_processed.<format> written next to it. The
+catalogue tables are read once up front and handed to every worker process,
+so workers never query the database; CRM details come from Odoo per file
+unless --no-crm is given.
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from pathlib import Path
+
+from database import SessionLocal
+from lookup_cache import load_lookups
+from output_formats import MEDIA_TYPES, SHEET_NAMES
+from workers import PIPELINE_WORKERS
+
+OUTPUT_SUFFIX = "_processed"
+
+# Catalogue copy of a worker process, set by _init_worker
+_lookups = None
+
+
+def _init_worker(lookups):
+    global _lookups
+    _lookups = lookups
+
+
+def process_file(path: str, fmt: str, sheet: str, fetch_crm: bool, allow_fuzzy: bool) -> dict:
+    """Run the /process-xlsx pipeline on one file and write its output next to it."""
+    import odoo
+    from pipeline import expand_quotation, parse_quotation, render_sales_order
+
+    started   = time.perf_counter()
+    quotation = parse_quotation(Path(path).read_bytes())
+    lookups   = _lookups.subset(quotation.models, quotation.finishes, allow_fuzzy)
+    order     = expand_quotation(quotation, lookups)
+    crm       = odoo.get_customer_poc(quotation.project_id) if fetch_crm else (None, None, None)
+    data      = render_sales_order(order, *crm, fmt, sheet)
+
+    out_path = Path(path).with_name(f"{Path(path).stem}{OUTPUT_SUFFIX}.{fmt}")
+    out_path.write_bytes(data)
+    return {
+        "output":  str(out_path),
+        "lines":   len(order.results),
+        "failed":  len(order.failed_rows),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def find_inputs(directory: Path) -> list:
+    return sorted(
+        path for path in directory.glob("*.xlsx")
+        if not path.name.startswith("~$") and not path.stem.endswith(OUTPUT_SUFFIX)
+    )
+
+
+def run(paths, workers: int, fmt: str, sheet: str, fetch_crm: bool,
+        allow_fuzzy: bool = False) -> int:
+    """Process `paths`, printing one line per file; returns the number of files that failed."""
+    with SessionLocal() as db:
+        started = time.perf_counter()
+        lookups = load_lookups(db)
+    print(f"Loaded catalogue in {time.perf_counter() - started:.2f}s: "
+          f"{len(lookups.cabinets)} cabinets, {len(lookups.colours)} colours, "
+          f"{len(lookups.odoo_codes)} codes")
+
+    def report(path, outcome):
+        try:
+            stats = outcome()
+        except Exception as e:
+            detail = getattr(e, "detail", None) or e
+            print(f"FAILED  {path.name}: {detail}")
+            return None
+        print(f"{stats['seconds']:7.2f}s  {path.name} -> {Path(stats['output']).name} "
+              f"({stats['lines']} lines, {stats['failed']} failed rows)")
+        return stats
+
+    started = time.perf_counter()
+    results = []
+    if workers > 0:
+        # "spawn", as in the server, so workers start clean of DB connections
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                                 initializer=_init_worker, initargs=(lookups,)) as pool:
+            futures = {
+                pool.submit(process_file, str(path), fmt, sheet, fetch_crm, allow_fuzzy): path
+                for path in paths
+            }
+            for future in as_completed(futures):
+                results.append(report(futures[future], future.result))
+    else:
+        _init_worker(lookups)
+        for path in paths:
+            results.append(report(path, lambda: process_file(str(path), fmt, sheet, fetch_crm,
+                                                            allow_fuzzy)))
+    elapsed = time.perf_counter() - started
+
+    done  = [stats for stats in results if stats is not None]
+    lines = sum(stats["lines"] for stats in done)
+    print(f"{len(done)}/{len(paths)} files, {lines} lines in {elapsed:.2f}s "
+          f"({len(done) / elapsed:.2f} files/s, {lines / elapsed:.0f} lines/s)")
+    return len(paths) - len(done)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Convert a directory of quotation exports.")
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("-j", "--workers", type=int, default=PIPELINE_WORKERS,
+                        help="worker processes; 0 runs in this process (default: PIPELINE_WORKERS)")
+    parser.add_argument("--format", default="xlsx", choices=list(MEDIA_TYPES))
+    parser.add_argument("--sheet", default="Success", choices=list(SHEET_NAMES),
+                        help="sheet written by --format csv")
+    parser.add_argument("--no-crm", action="store_true",
+                        help="skip the Odoo lookup and use the default customer details")
+    parser.add_argument("--allow-fuzzy", action="store_true",
+                        help="use the closest colour for finishes that match none exactly "
+                             "(default: list them as failed rows)")
+    args = parser.parse_args(argv)
+
+    if not args.directory.is_dir():
+        parser.error(f"{args.directory} is not a directory")
+    paths = find_inputs(args.directory)
+    if not paths:
+        print(f"No .xlsx files in {args.directory}")
+        return 0
+
+    print(f"Processing {len(paths)} files with {args.workers or 'no'} worker processes")
+    failed = run(paths, args.workers, args.format, args.sheet, not args.no_crm,
+                 args.allow_fuzzy)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
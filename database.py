@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 import os
@@ -10,6 +11,8 @@ DATABASE_URL = (
     f"@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
 )
 
+ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+
 engine = create_engine(
     DATABASE_URL,
     echo=True,
@@ -17,12 +20,26 @@ engine = create_engine(
     max_overflow=20
 )
 
+# Used by the request path so lookups never hold a threadpool slot
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=True,
+    pool_size=10,
+    max_overflow=20
+)
+
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
     bind=engine
 )
 
+AsyncSessionLocal = async_sessionmaker(
+    autoflush=False,
+    bind=async_engine,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 def get_db():
@@ -31,3 +48,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
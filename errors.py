@@ -0,0 +1,9 @@
+"""Exceptions whose message is meant for the person who sent the request."""
+
+
+class DetailError(Exception):
+    """Base for errors carrying a user-facing `detail` (an HTTP detail or a CLI message)."""
+
+    def __init__(self, detail):
+        super().__init__(detail)
+        self.detail = detail
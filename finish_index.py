@@ -0,0 +1,100 @@
+"""
+Finish-name matching against the `colorcode` table.
+
+Sheet finishes rarely differ from the catalogue by more than case, spacing
+or a typo, so instead of failing on anything but an exact name, FinishIndex
+tries, in order:
+
+    exact       the name as written
+    normalized  case-folded with whitespace collapsed ("Glacier veil  gloss ")
+    fuzzy       the closest name by character trigrams (Dice coefficient), if
+                it scores at least FINISH_MATCH_THRESHOLD and clearly better
+                than the runner-up
+
+Exact and normalized matches are one dict lookup; fuzzy candidates come
+from an inverted trigram index built once per catalogue load. A fuzzy match
+is only a suggestion: rows using it fail with the suggested colour unless the
+request sets allow_fuzzy.
+"""
+import os
+from collections import Counter
+from dataclasses import dataclass
+
+from memo import BoundedMemo
+
+# Lowest trigram similarity (0..1) accepted for a fuzzy match; 1 disables them
+FINISH_MATCH_THRESHOLD = float(os.getenv("FINISH_MATCH_THRESHOLD", "0.8"))
+
+# How far the best fuzzy candidate must score above the next one
+_MIN_MARGIN = 0.05
+
+# Fuzzy answers remembered per index before the memo starts over
+_MEMO_SIZE = 4096
+
+
+@dataclass(frozen=True)
+class FinishMatch:
+    colour_name: str
+    colour_code: str
+    kind: str           # "exact", "normalized" or "fuzzy"
+    score: float = 1.0
+
+    @property
+    def exact(self) -> bool:
+        return self.kind != "fuzzy"
+
+
+def normalize_finish(name: str) -> str:
+    return " ".join(str(name).casefold().split())
+
+
+def _trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FinishIndex:
+    def __init__(self, colours: dict, threshold: float = FINISH_MATCH_THRESHOLD):
+        """`colours` maps colour_name -> colour_code, as in Lookups.colours."""
+        self.threshold   = threshold
+        self._colours    = colours
+        self._normalized = {}   # normalized name -> colour_name, first one wins
+        for name in colours:
+            self._normalized.setdefault(normalize_finish(name), name)
+
+        self._keys     = list(self._normalized)
+        self._grams    = [_trigrams(key) for key in self._keys]
+        self._postings = {}     # trigram -> indexes into _keys
+        for i, grams in enumerate(self._grams):
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(i)
+        self._memo = BoundedMemo(self._closest, _MEMO_SIZE)
+
+    def match(self, finish: str) -> FinishMatch | None:
+        if finish in self._colours:
+            return FinishMatch(finish, self._colours[finish], "exact")
+
+        key  = normalize_finish(finish)
+        name = self._normalized.get(key)
+        if name is not None:
+            return FinishMatch(name, self._colours[name], "normalized")
+
+        return self._memo(key)
+
+    def _closest(self, key: str) -> FinishMatch | None:
+        if self.threshold >= 1 or not key:
+            return None
+        grams  = _trigrams(key)
+        shared = Counter(i for gram in grams for i in self._postings.get(gram, ()))
+
+        best, best_score, runner_up = None, 0.0, 0.0
+        for i, count in shared.items():
+            score = 2 * count / (len(grams) + len(self._grams[i]))
+            if score > best_score:
+                best, best_score, runner_up = i, score, best_score
+            elif score > runner_up:
+                runner_up = score
+        if best is None or best_score < self.threshold or best_score - runner_up < _MIN_MARGIN:
+            return None
+        name = self._normalized[self._keys[best]]
+        return FinishMatch(name, self._colours[name], "fuzzy", round(best_score, 3))
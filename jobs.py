@@ -0,0 +1,144 @@
+"""
+In-process job queue for work too slow to hold an HTTP request open for.
+
+`submit` queues a coroutine function and returns a Job straight away; a
+fixed number of worker tasks on the event loop run jobs in order, so at
+most JOB_WORKERS pipelines are in flight however many are submitted.
+Finished jobs keep their result for JOB_RESULT_TTL seconds and are then
+dropped, or sooner, oldest first, once the kept results add up to more
+than JOB_RESULT_MAX_BYTES. Jobs live in this process only: they do not
+survive a restart and are not shared between server processes.
+"""
+import asyncio
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from fastapi import HTTPException
+
+# Jobs run at the same time
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Jobs waiting to start before submit is refused
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+# How long a finished job and its result are kept (seconds)
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+# Total size of the results kept for finished jobs (bytes)
+JOB_RESULT_MAX_BYTES = int(os.getenv("JOB_RESULT_MAX_BYTES", str(256 * 1024 * 1024)))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    fn: object = field(repr=False)
+    args: tuple = field(repr=False)
+    meta: dict = field(default_factory=dict)    # caller's details, echoed in summary()
+    status: str = QUEUED
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    result: object = field(default=None, repr=False)
+    error_status: int | None = None
+    error: object = None
+
+    def summary(self) -> dict:
+        return {
+            "job_id":       self.id,
+            "status":       self.status,
+            "submitted_at": self.submitted_at,
+            "started_at":   self.started_at,
+            "finished_at":  self.finished_at,
+            "error":        self.error,
+            **self.meta,
+        }
+
+
+def _result_size(job: Job) -> int:
+    return len(job.result) if isinstance(job.result, (bytes, bytearray)) else 0
+
+
+class JobQueue:
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_SIZE,
+                 result_ttl: float = JOB_RESULT_TTL, max_result_bytes: int = JOB_RESULT_MAX_BYTES):
+        self.workers          = max(1, workers)
+        self.max_queued       = max_queued
+        self.result_ttl       = result_ttl
+        self.max_result_bytes = max_result_bytes
+        self._jobs            = {}
+        self._queue           = None
+        self._tasks           = []
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(self.max_queued)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, fn, *args, meta=None) -> Job:
+        """Queue `await fn(*args)`; raise QueueFullError when the backlog is full."""
+        if not self._tasks:
+            raise RuntimeError("Job queue is not running")
+        self._purge()
+        job = Job(uuid.uuid4().hex, fn, args, meta or {})
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"{self.max_queued} jobs are already waiting")
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        self._purge()
+        return self._jobs.get(job_id)
+
+    def _purge(self):
+        cutoff  = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+        # Then the oldest results past the size cap; the newest is always kept
+        finished = sorted((job for job in self._jobs.values() if job.finished_at is not None),
+                          key=lambda job: job.finished_at)
+        total    = sum(_result_size(job) for job in finished)
+        for job in finished[:-1]:
+            if total <= self.max_result_bytes:
+                break
+            total -= _result_size(job)
+            del self._jobs[job.id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status     = RUNNING
+            job.started_at = time.time()
+            try:
+                job.result = await job.fn(*job.args)
+                job.status = DONE
+            except HTTPException as e:
+                job.status, job.error_status, job.error = FAILED, e.status_code, e.detail
+            except Exception as e:
+                print(f"Job {job.id} failed: {e!r}")
+                job.status, job.error_status, job.error = FAILED, 500, f"Job failed: {e}"
+            finally:
+                # The arguments (the uploaded workbook) are not needed once it has run
+                job.args        = ()
+                job.finished_at = time.time()
+                self._queue.task_done()
+                self._purge()
+
+
+job_queue = JobQueue()
@@ -0,0 +1,303 @@
+import asyncio
+import os
+import time
+
+from sqlalchemy import bindparam, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from finish_index import FinishIndex
+from models import Cabinet, CabinetBom, CodeRaw, ColorCode
+
+# Full reload at least this often, even if no change was detected (seconds)
+LOOKUP_CACHE_TTL = float(os.getenv("LOOKUP_CACHE_TTL", "300"))
+# Minimum gap between two catalogue version checks (seconds)
+LOOKUP_CACHE_CHECK_INTERVAL = float(os.getenv("LOOKUP_CACHE_CHECK_INTERVAL", "5"))
+# "cache": serve lookups from the process-wide table copy
+# "prefetch": fetch only the keys a sheet uses, one IN (...) query per table
+LOOKUP_MODE = os.getenv("LOOKUP_MODE", "cache").strip().lower()
+
+LOOKUP_TABLES = ("cabinets", "cabinet_bom", "colorcode", "code_raw")
+
+# Write counters move on every insert/update/delete, so together they act as a
+# cheap version stamp for the catalogue tables. The counters
+# are published with a small delay; the catalogue_version row, bumped by the
+# bulk loader in the same transaction as a refresh, moves the moment it commits.
+# That table only exists once migration 3 has run, so it is read in a second
+# query, and only when the stats list it; before that the counters alone serve
+# and a check costs one round trip instead of two.
+_VERSION_SQL = text(
+    "SELECT relname, n_tup_ins, n_tup_upd, n_tup_del "
+    "FROM pg_stat_user_tables WHERE relname IN :tables ORDER BY relname"
+).bindparams(bindparam("tables", value=[*LOOKUP_TABLES, "catalogue_version"], expanding=True))
+_CATALOGUE_VERSION_SQL = text("SELECT version FROM catalogue_version WHERE id = 1")
+
+
+def _has_catalogue_version(stats) -> bool:
+    return any(row[0] == "catalogue_version" for row in stats)
+
+
+class Lookups:
+    """
+    Read-only catalogue maps, keyed the way the row processors look them up:
+        cabinets    cabinet_code  -> BOM product codes in ordinal order
+        colours     colour_name   -> colour_code
+        odoo_codes  infurnia_code -> odoo_code
+    A key that is present with a None value means the row exists but the
+    column is empty, which the processors treat differently from a missing row.
+
+    `fuzzy_finishes` holds the sheet finishes that `subset` could only match
+    approximately: finish -> FinishMatch. Their colour codes are in `colours`,
+    under the sheet's spelling, only when the caller allowed fuzzy matches.
+    """
+
+    __slots__ = ("cabinets", "colours", "odoo_codes", "fuzzy_finishes", "_finish_index")
+
+    def __init__(self, cabinets=None, colours=None, odoo_codes=None, fuzzy_finishes=None):
+        self.cabinets       = cabinets if cabinets is not None else {}
+        self.colours        = colours if colours is not None else {}
+        self.odoo_codes     = odoo_codes if odoo_codes is not None else {}
+        self.fuzzy_finishes = fuzzy_finishes if fuzzy_finishes is not None else {}
+        self._finish_index  = None
+
+    def __getstate__(self):
+        # The finish index is rebuilt on demand rather than pickled
+        return (self.cabinets, self.colours, self.odoo_codes, self.fuzzy_finishes)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def match_finish(self, finish):
+        """FinishMatch for a sheet finish, or None; see finish_index."""
+        if self._finish_index is None:
+            self._finish_index = FinishIndex(self.colours)
+        return self._finish_index.match(finish)
+
+    def subset(self, models, finishes, allow_fuzzy: bool = False) -> "Lookups":
+        """
+        Only the entries one sheet can hit — small enough to ship to a worker
+        process. Finishes without an exact colour name are matched through
+        the finish index and stored under the sheet's spelling; approximate
+        matches are always recorded, but only used with `allow_fuzzy`.
+        """
+        colours = {}
+        fuzzy   = {}
+        for finish in finishes:
+            match = self.fuzzy_finishes.get(finish)
+            if match is None:
+                if finish in self.colours:
+                    colours[finish] = self.colours[finish]
+                    continue
+                match = self.match_finish(finish)
+                if match is None:
+                    continue
+            if not match.exact:
+                fuzzy[finish] = match
+                if not allow_fuzzy:
+                    continue
+            colours[finish] = match.colour_code
+        return Lookups(
+            {m: self.cabinets[m] for m in models if m in self.cabinets},
+            colours,
+            {m: self.odoo_codes[m] for m in models if m in self.odoo_codes},
+            fuzzy,
+        )
+
+
+# ── Queries ───────────────────────────────────────────────────────────────────
+# Built once and run by both the sync and the async session, so the two
+# data-access paths cannot drift apart.
+
+def _lookup_statements(cabinet_codes=None, colour_names=None, infurnia_codes=None):
+    """
+    One statement per table, or None where an empty key set makes the query
+    pointless. Rows come back in primary-key order and the first row per key
+    wins, which matches what the old per-row `.first()` queries returned.
+    """
+    # Cabinets with their BOM lines in one query; a cabinet without lines
+    # still comes back once, with a NULL product code
+    cabinet_q = (
+        select(Cabinet.cabinet_code, CabinetBom.product_code)
+        .outerjoin(CabinetBom, CabinetBom.cabinet_id == Cabinet.id)
+        .order_by(Cabinet.id, CabinetBom.ordinal)
+    )
+    colour_q  = select(ColorCode.colour_name, ColorCode.colour_code).order_by(ColorCode.id)
+    code_q    = select(CodeRaw.infurnia_code, CodeRaw.odoo_code)
+
+    if cabinet_codes is not None:
+        cabinet_q = cabinet_q.where(Cabinet.cabinet_code.in_(cabinet_codes)) if cabinet_codes else None
+    if colour_names is not None:
+        colour_q = colour_q.where(ColorCode.colour_name.in_(colour_names)) if colour_names else None
+    if infurnia_codes is not None:
+        code_q = code_q.where(CodeRaw.infurnia_code.in_(infurnia_codes)) if infurnia_codes else None
+    return cabinet_q, colour_q, code_q
+
+
+def _build_lookups(cabinet_rows, colour_rows, code_rows) -> Lookups:
+    cabinets = {}
+    for code, product in cabinet_rows:
+        bom_lines = cabinets.setdefault(code, [])
+        if product:
+            bom_lines.append(product)
+    cabinets = {code: tuple(bom_lines) for code, bom_lines in cabinets.items()}
+
+    colours = {}
+    for name, code in colour_rows:
+        colours.setdefault(name, code)
+
+    return Lookups(cabinets, colours, dict(code_rows))
+
+
+def load_lookups(db: Session, cabinet_codes=None, colour_names=None, infurnia_codes=None) -> Lookups:
+    """
+    Read the catalogue tables into a Lookups instance with one query per table.
+    Passing a set of keys restricts that table to `key IN (...)`; an empty set
+    skips the query.
+    """
+    rows = [
+        db.execute(stmt).all() if stmt is not None else []
+        for stmt in _lookup_statements(cabinet_codes, colour_names, infurnia_codes)
+    ]
+    return _build_lookups(*rows)
+
+
+async def load_lookups_async(db: AsyncSession, cabinet_codes=None, colour_names=None,
+                             infurnia_codes=None) -> Lookups:
+    """`load_lookups` over an AsyncSession."""
+    rows = [
+        (await db.execute(stmt)).all() if stmt is not None else []
+        for stmt in _lookup_statements(cabinet_codes, colour_names, infurnia_codes)
+    ]
+    return _build_lookups(*rows)
+
+
+def _prefetch_keys(models, finishes) -> dict:
+    models   = sorted(set(models))
+    finishes = sorted(set(finishes))
+    return dict(cabinet_codes=models, colour_names=finishes, infurnia_codes=models)
+
+
+async def prefetch_lookups_async(db: AsyncSession, models, finishes,
+                                 allow_fuzzy: bool = False) -> Lookups:
+    """
+    Per-request alternative to the full-table cache: resolve every distinct
+    model and finish of one sheet with at most three queries, however many
+    rows the sheet has. Finishes without an exact colour name cost one more
+    query, for the whole colour table, to match them through the finish index.
+    """
+    lookups = await load_lookups_async(db, **_prefetch_keys(models, finishes))
+    missing = set(finishes) - lookups.colours.keys()
+    if missing:
+        all_colours = await load_lookups_async(db, cabinet_codes=(), infurnia_codes=())
+        _match_finishes(lookups, all_colours, missing, allow_fuzzy)
+    return lookups
+
+
+def _match_finishes(lookups: Lookups, all_colours: Lookups, finishes, allow_fuzzy: bool):
+    matched = all_colours.subset((), finishes, allow_fuzzy)
+    lookups.colours.update(matched.colours)
+    lookups.fuzzy_finishes.update(matched.fuzzy_finishes)
+
+
+# ── Cache ─────────────────────────────────────────────────────────────────────
+
+class LookupCache:
+    """
+    Process-wide copy of the `cabinets`, `colorcode` and `code_raw` tables.
+
+    `get_async(db)` costs zero round trips while the copy is fresh, one or
+    two when the version stamp is re-checked, and a full reload only when
+    the stamp changed or LOOKUP_CACHE_TTL has elapsed.
+    """
+
+    def __init__(self, ttl: float = LOOKUP_CACHE_TTL,
+                 check_interval: float = LOOKUP_CACHE_CHECK_INTERVAL):
+        self.ttl            = ttl
+        self.check_interval = check_interval
+        self._lookups       = None
+        self._version       = None
+        self._loaded_at     = 0.0
+        self._checked_at    = 0.0
+        self._async_lock    = None
+
+    def _due(self) -> str | None:
+        """What the cache needs right now: "reload", "check" or None."""
+        now = time.monotonic()
+        if self._lookups is None or now - self._loaded_at >= self.ttl:
+            return "reload"
+        if now - self._checked_at >= self.check_interval:
+            return "check"
+        return None
+
+    async def get_async(self, db: AsyncSession) -> Lookups:
+        if self._due() is None:
+            return self._lookups
+
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            due = self._due()
+            if due is not None:
+                started = time.monotonic()
+                version = await self._fetch_version_async(db)
+                self._checked_at = time.monotonic()
+                if due == "reload" or version is None or version != self._version:
+                    self._store(await load_lookups_async(db), version, started)
+            return self._lookups
+
+    @property
+    def version(self):
+        """Version stamp of the loaded copy; None if unknown (see _fetch_version_async)."""
+        return self._version
+
+    def invalidate(self):
+        """Force a full reload on the next `get`."""
+        self._loaded_at = float("-inf")
+
+    def _store(self, lookups: Lookups, version, started: float):
+        self._lookups = lookups
+        self._version = version
+        self._loaded_at = self._checked_at = time.monotonic()
+        print(
+            f"Lookup cache loaded: {len(lookups.cabinets)} cabinets, "
+            f"{len(lookups.colours)} colours, {len(lookups.odoo_codes)} codes "
+            f"in {self._loaded_at - started:.3f}s"
+        )
+
+    @staticmethod
+    async def _fetch_version_async(db: AsyncSession):
+        try:
+            stats = tuple(tuple(row) for row in await db.execute(_VERSION_SQL))
+            if _has_catalogue_version(stats):
+                stats += (((await db.execute(_CATALOGUE_VERSION_SQL)).scalar(),),)
+            return stats
+        except SQLAlchemyError as e:
+            # No stats view (non-Postgres DB or missing privileges): fall back
+            # to reloading on every check instead of serving stale data.
+            await db.rollback()
+            print(f"Could not read catalogue version, reloading lookups: {e}")
+            return None
+
+
+lookup_cache = LookupCache()
+
+
+async def resolve_lookups_async(db: AsyncSession, models, finishes,
+                                allow_fuzzy: bool = False) -> Lookups:
+    """Lookups for one sheet, from the shared cache or a prefetch depending on LOOKUP_MODE."""
+    if LOOKUP_MODE == "prefetch":
+        return await prefetch_lookups_async(db, models, finishes, allow_fuzzy)
+    return (await lookup_cache.get_async(db)).subset(models, finishes, allow_fuzzy)
+
+
+async def catalogue_version_async(db: AsyncSession):
+    """
+    Current version stamp of the catalogue tables, or None where it
+    cannot be read. In cache mode this is the stamp the cache last checked,
+    so it is at most LOOKUP_CACHE_CHECK_INTERVAL seconds old.
+    """
+    if LOOKUP_MODE == "prefetch":
+        return await LookupCache._fetch_version_async(db)
+    await lookup_cache.get_async(db)
+    return lookup_cache.version
@@ -476,25 +476,51 @@
 #     )
 
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
-from fastapi.responses import StreamingResponse
+import asyncio
+import hashlib
+import secrets
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Header, Query
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import pandas as pd
-import re
-import io
-from models import Cabinet, CodeRaw, ColorCode
-from sqlalchemy.orm import Session
-from database import get_db
-from models import Cabinet, ColorCode
-from odoo import get_customer_poc
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, async_engine, get_async_db
+from batch import BatchError, pack_outputs, unpack_uploads
+from catalogue_loader import TABLE_COLUMNS, CatalogueError, current_version, load_catalogue
+from jobs import DONE, FAILED, QueueFullError, job_queue
+from lookup_cache import catalogue_version_async, lookup_cache, resolve_lookups_async
+from output_formats import MEDIA_TYPES, SHEET_NAMES
+import odoo
+from pipeline import (
+    FAILED_COLUMNS, LINE_COLUMNS, ParsedQuotation, QuotationError, SalesOrder,
+    diff_rows, expand_quotation, parse_quotation, render_sales_order, stream_sales_order,
+)
+from result_cache import result_cache
+from snapshots import dump_snapshot, load_snapshot, project_snapshots
+from workers import run_cpu_bound, shutdown_pool
 import os
-import math
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Token the /admin endpoints expect in X-Admin-Token; unset disables them
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+
+# Token /push-to-odoo expects in X-Push-Token; unset disables it
+PUSH_API_TOKEN = os.getenv("PUSH_API_TOKEN")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_queue.start()
+    yield
+    await job_queue.stop()
+    shutdown_pool()
+    await odoo.aclose()
+    await async_engine.dispose()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 origins = os.getenv("ALLOWED_ORIGINS", "*")
 origins_list = [origin.strip() for origin in origins.split(",") if origin]
@@ -508,470 +534,420 @@ app.add_middleware(
 )
 
 
-# ── Utilities ─────────────────────────────────────────────────────────────────
-
-def normalize_text(value):
-    if value is None or pd.isna(value):
-        return None
-    value = str(value).strip()
-    return value if value else None
-
-
-# ── Mappings ──────────────────────────────────────────────────────────────────
-
-SHUTTER_FINISH_MAPPING = {
-    "Sandalwood":      "Courtyard Clay Gloss",
-    "Soundcloud":      "Mistfield Gloss",
-    "Washed Earth":    "Canyon Ridge Gloss",
-    "Starlight White": "Glacier Veil Gloss",
-    "Asteroid Belt":   "Industrial Bay Matte",
-}
-
-PRELAM_FINISHES = {
-    "Back Painted Fluted Glass Ivory Matt (Prelam)",
-    "Back Painted Fluted Glass Ash Matt (Prelam)",
-    "Back Painted Fluted Glass Biscuit Matt (Prelam)",
-    "Back Painted Fluted Glass Maple Bronze Gloss (Prelam)",
-    "Back Painted Frosted Glass Beige Matt (Prelam)",
-    "Back Painted Frosted Glass Graphite Matt (Prelam)",
-    "Back Painted Sandstone Gloss (Prelam)",
-    "Back Painted Pebble Gloss (Prelam)",
-    "Fluted Glass Vanilla Matt (Prelam)",
-    "Fluted Glass Coffee Matt (Prelam)",
-    "Fluted Glass Onyx Matt (Prelam)",
-    "Fluted Glass Snow Gloss (Prelam)",
-    "Fluted Glass Caramel Gloss (Prelam)",
-    "Fluted Glass Black Gloss (Prelam)",
-    "Sandwich Glass Bronze Veil (Prelam)",
-    "Frosted Glass Mist (Prelam)",
-}
-
-# Maps glass-shutter model codes -> human-readable profile description
-GLASS_SHUTTER_PROFILE_MAPPING = {
-    "KAPS-59 MB": "GLASS SHUTTER PROFILE: Matt Black ( KAPS-59 MB )",
-    "KAPS-59 MG": "GLASS SHUTTER PROFILE: Matt Gold ( KAPS-59 MG )",
-    "KAPS-59 SS": "GLASS SHUTTER PROFILE: Silver ( KAPS-59 SS )",
-    "SCP-06 MB":  "GLASS SHUTTER PROFILE: Matt Black ( SCP-06 MB )",
-    "SCP-06 MG":  "GLASS SHUTTER PROFILE: Matt Gold ( SCP-06 MG )",
-    "SCP-06 SS":  "GLASS SHUTTER PROFILE: Silver ( SCP-06 SS )",
-    "KSP-01 MB":  "GLASS SHUTTER PROFILE: Matt Black ( KSP-01 MB )",
-    "KSP-01 MG":  "GLASS SHUTTER PROFILE: Matt Gold ( KSP-01 MG )",
-    "KSP-01 SS":  "GLASS SHUTTER PROFILE: Silver ( KSP-01 SS )",
-    "BGK-01":     "GLASS SHUTTER PROFILE: Rose Gold 20 mm Profile",
-}
-
-GLASS_SHUTTER_MODELS = set(GLASS_SHUTTER_PROFILE_MAPPING.keys())
-
-
-# ── Extractors ────────────────────────────────────────────────────────────────
-
-def is_glass_shutter_model(model: str | None) -> bool:
-    return model in GLASS_SHUTTER_MODELS
-
-
-def extract_model(text: str | None):
-    if text is None or (isinstance(text, float) and pd.isna(text)):
-        return None
-    # Captures full model name until newline — handles "MK-0458" and "KSP-01 MG"
-    m = re.search(r"Model:\s*(.+?)(?:\n|$)", str(text))
-    return m.group(1).strip() if m else None
-
-
-def extract_shutter_finish(text: str | None):
-    if text is None or (isinstance(text, float) and pd.isna(text)):
-        return None
-
-    s = str(text)
-
-    # Primary: "Shutter Finish : <value>"
-    m = re.search(r"Shutter.*?Finish\s*:\s*(.+?)(?:\n|$)", s, re.DOTALL)
-    if m:
-        finish = m.group(1).strip()
-        return SHUTTER_FINISH_MAPPING.get(finish, finish)
-
-    # Fallback 1: cell directly contains a known Prelam finish string
-    s_stripped = s.strip()
-    if s_stripped in PRELAM_FINISHES:
-        return s_stripped
-
-    # Fallback 2: generic "Finish : <value>" without "Shutter" prefix
-    m2 = re.search(r"Finish\s*:\s*(.+?)(?:\n|$)", s, re.DOTALL)
-    if m2:
-        finish = m2.group(1).strip()
-        return SHUTTER_FINISH_MAPPING.get(finish, finish)
-
-    return None
-
-
-def build_glass_shutter_description(mk_product: str, glass_model: str, prelam_finish: str) -> str:
-    """
-    3-line description for a glass-shutter MK-prelam row:
-        [MK-XXXX]
-        GLASS SHUTTER PROFILE: <profile label>
-        GLASS PROFILE: <prelam finish>
-    """
-    profile_label = GLASS_SHUTTER_PROFILE_MAPPING.get(glass_model, glass_model)
-    return f"[{mk_product}]\n{profile_label}\nGLASS PROFILE: {prelam_finish}"
+# ── Shared steps ──────────────────────────────────────────────────────────────
 
+def check_token(given: str | None, expected: str | None, disabled: str):
+    """403 while `expected` is unset, 401 unless `given` matches it."""
+    if not expected:
+        raise HTTPException(status_code=403, detail=disabled)
+    # Bytes, as compare_digest refuses str with non-ASCII characters
+    if given is None or not secrets.compare_digest(given.encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Invalid token")
 
-# ── FastAPI endpoint ───────────────────────────────────────────────────────────
 
-@app.post("/process-xlsx")
-async def process_xlsx(
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db)
-):
+def check_output_format(output_format: str, sheet: str, diff: bool = False) -> str:
+    output_format = output_format.lower()
+    if output_format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400,
+                            detail=f"format must be one of: {', '.join(MEDIA_TYPES)}")
+    sheets = SHEET_NAMES + (("Changes",) if diff else ())
+    if output_format == "csv" and sheet.lower() not in {name.lower() for name in sheets}:
+        raise HTTPException(status_code=400,
+                            detail=f"sheet must be one of: {', '.join(sheets)}")
+    return output_format
+
+
+async def read_upload(file: UploadFile) -> bytes:
     if not file.filename.lower().endswith(".xlsx"):
         raise HTTPException(status_code=400, detail="Please upload a .xlsx file")
+    return await file.read()
 
-    contents = await file.read()
 
+async def parse_workbook(contents: bytes) -> ParsedQuotation:
+    # Parsing and row expansion are CPU-bound and run in the worker pool; DB
+    # and Odoo calls are awaited on the event loop, so one worker keeps many
+    # requests in flight while each waits on I/O. Outputs rendered whole (jobs,
+    # batches) are written in the pool too; /process-xlsx streams its output
+    # from a thread of this process instead, see there.
     try:
-        excel_bytes = io.BytesIO(contents)
-        raw_df = pd.read_excel(excel_bytes, sheet_name=0, header=None, engine="openpyxl")
-        df     = pd.read_excel(excel_bytes, header=2, engine="openpyxl")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Unable to read Excel file: {e}")
-
-    # ── Column validation ─────────────────────────────────────────────────────
-    df.columns = df.columns.astype(str).str.strip()
-    required_cols = ["Reference", "Item", "Finishes"]
-    missing = [c for c in required_cols if c not in df.columns]
-    if missing:
-        raise HTTPException(status_code=400, detail=f"Missing columns in sheet: {missing}")
-
-    # ── Quantity column (immediately right of "Finishes") ─────────────────────
-    try:
-        finishes_col_idx = df.columns.get_loc("Finishes")
-        quantity_col     = df.columns[finishes_col_idx + 1]
-    except (KeyError, IndexError):
-        raise HTTPException(
-            status_code=400,
-            detail="Could not find the Quantity column (expected right after 'Finishes')"
-        )
-
-    def compute_quantity(val):
-        try:
-            match = re.search(r"[\d.]+", str(val))
-            if not match:
-                return 1
-            q = float(match.group())
-            if q == 1:
-                return 1
-            return math.ceil(q / 3) + 1
-        except (ValueError, TypeError):
-            return 1
-
-    df["Quantity"] = df[quantity_col].apply(compute_quantity)
-
-    # ── Project ID ────────────────────────────────────────────────────────────
+        return await run_cpu_bound(parse_quotation, contents)
+    except QuotationError as e:
+        raise HTTPException(status_code=400, detail=e.detail)
+
+
+async def expand_upload(quotation: ParsedQuotation, db: AsyncSession, version,
+                        diff: bool = False, allow_fuzzy: bool = False) -> SalesOrder:
+    """`version` is the catalogue stamp the handler read once for the request."""
+    # ── Lookups: every catalogue row this sheet needs, resolved up front ──────
+    lookups = await resolve_lookups_async(db, quotation.models, quotation.finishes, allow_fuzzy)
+
+    # A revision of the project's last upload copies its unchanged rows over,
+    # as long as they were expanded against the same catalogue and with the
+    # same fuzzy-match setting
+    stamp           = (version, allow_fuzzy)
+    known, previous = project_snapshots.get(quotation.project_id)
+    reusable        = previous if version is not None and stamp == known else None
+
+    order = await run_cpu_bound(expand_quotation, quotation, lookups, reusable)
+    if diff:
+        order.changes = diff_rows(previous, order.rows)
+    project_snapshots.put(quotation.project_id, stamp, order.rows)
+    return order
+
+
+async def expand_with_crm(quotation: ParsedQuotation, db: AsyncSession, version,
+                          diff: bool = False, allow_fuzzy: bool = False):
+    """The SalesOrder plus (project_name, customer, poc) from the sheet's CRM lead."""
+    # The CRM details are only needed for the first order line, so the Odoo
+    # round trip runs alongside the lookups and row expansion and is joined
+    # just before the output is written.
+    crm_id = quotation.project_id
+    print(f"Fetching customer and POC details for CRM ID: {crm_id}")
+    crm_task = asyncio.create_task(odoo.get_customer_poc_async(crm_id))
+
     try:
-        cell_value       = str(raw_df.iloc[1, 2])
-        project_id_match = re.search(r"^\s*(\d+)", cell_value)
-        if not project_id_match:
-            raise HTTPException(status_code=400, detail="Project ID not found in the file")
-        project_id = project_id_match.group(1)
-    except HTTPException:
+        order = await expand_upload(quotation, db, version, diff, allow_fuzzy)
+    except BaseException:
+        crm_task.cancel()
         raise
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error extracting Project ID: {e}")
 
-    crm_id = project_id
-    print(f"Fetching customer and POC details for CRM ID: {crm_id}")
-    project_name, customer, poc = get_customer_poc(crm_id)
+    project_name, customer, poc = await crm_task
     if project_name is None:
         print(f"No CRM lead found for ID: {crm_id}, skipping...")
+    return order, project_name, customer, poc
+
+
+async def cached_output(contents: bytes, version, allow_fuzzy: bool, output_format: str,
+                        sheet: str):
+    """
+    (cache key, stored output or None) for an upload; see result_cache. A hit
+    also puts back the project snapshot the upload left when it was expanded,
+    so the next revision is reused and diffed against this upload.
+    """
+    key  = result_cache.key(contents, version, allow_fuzzy, output_format, sheet)
+    data = await asyncio.to_thread(result_cache.get, key)
+    if data is None:
+        return key, None
+    stored = await asyncio.to_thread(result_cache.get,
+                                     result_cache.key(contents, version, allow_fuzzy, "snapshot"))
+    if stored is None:
+        return key, None  # the snapshot aged out first: expand again
+    project_id, rows = load_snapshot(stored)
+    project_snapshots.put(project_id, (version, allow_fuzzy), rows)
+    return key, data
+
+
+async def cache_snapshot(contents: bytes, version, allow_fuzzy: bool,
+                         quotation: ParsedQuotation, order: SalesOrder):
+    """Store the upload's project snapshot for `cached_output` to restore."""
+    key = result_cache.key(contents, version, allow_fuzzy, "snapshot")
+    if key is None:
+        return
+    data = dump_snapshot(quotation.project_id, order.rows)
+    if data is not None:
+        await asyncio.to_thread(result_cache.put, key, data)
+
+
+def download_headers(output_format: str) -> dict:
+    return {"Content-Disposition": f'attachment; filename="processed_output.{output_format}"'}
+
+
+def failed_rows_json(order: SalesOrder) -> list:
+    return [dict(zip(FAILED_COLUMNS, row)) for row in order.failed_rows.rows()]
+
+
+# ── FastAPI endpoint ───────────────────────────────────────────────────────────
+
+@app.post("/process-xlsx")
+async def process_xlsx(
+    file: UploadFile = File(...),
+    output_format: str = Query("xlsx", alias="format"),
+    sheet: str = Query("Success"),
+    diff: bool = Query(False),
+    allow_fuzzy: bool = Query(False),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    `format` picks the response: xlsx (default) or, for machine consumers,
+    csv (the one sheet named by `sheet`), ndjson or json with the same rows.
+    With `diff`, a Changes sheet lists the lines added, removed or changed
+    since the project's previous upload. Finishes that only match a colour
+    approximately go to the Failed sheet with the suggested colour, unless
+    `allow_fuzzy` lets the closest match through.
+    """
+    output_format = check_output_format(output_format, sheet, diff)
+    contents      = await read_upload(file)
+    # Read once and shared by the cache key and the row reuse check
+    version       = await catalogue_version_async(db)
+
+    # The same bytes against the same catalogue give the same output; a diff
+    # depends on the upload before, so it is never served from the cache
+    cache_key, cached = None, None
+    if not diff:
+        cache_key, cached = await cached_output(contents, version, allow_fuzzy, output_format,
+                                                sheet)
+    if cached is not None:
+        print("Returning cached output for a repeated upload")
+        return Response(cached, media_type=MEDIA_TYPES[output_format],
+                        headers=download_headers(output_format))
+
+    quotation = await parse_workbook(contents)
+    order, project_name, customer, poc = await expand_with_crm(quotation, db, version, diff,
+                                                               allow_fuzzy)
+    if cache_key is not None:
+        await cache_snapshot(contents, version, allow_fuzzy, quotation, order)
+
+    # The output is serialized while it is sent: StreamingResponse pulls
+    # the chunks from this generator in a threadpool thread of this process,
+    # not in the worker pool, so a large workbook's writing shares this
+    # process's CPU (and GIL) with the event loop while it streams.
+    chunks = stream_sales_order(order, project_name, customer, poc, output_format, sheet)
+    return StreamingResponse(
+        result_cache.store_stream(cache_key, chunks),
+        media_type=MEDIA_TYPES[output_format],
+        headers=download_headers(output_format)
+    )
 
-    # ── Derive model / finish / reference columns ─────────────────────────────
-    df["Model"]          = df["Item"].apply(extract_model)
-    df["Shutter_Finish"] = df["Finishes"].apply(extract_shutter_finish)
-    df["Reference"]      = df["Reference"].apply(normalize_text)
 
-    results     = []
-    failed_rows = []
+def require_push_token(x_push_token: str | None = Header(None)):
+    check_token(x_push_token, PUSH_API_TOKEN, "Pushing to Odoo is disabled; set PUSH_API_TOKEN")
 
-    # ── Service Charges quantity ──────────────────────────────────────────────
-    service_charge_qty = None
+
+# Origins of the pushes running in this process, so a double submit gets a
+# 409 instead of racing the existing-order check in Odoo
+_pushes_in_flight = set()
+
+
+@app.post("/push-to-odoo", dependencies=[Depends(require_push_token)])
+async def push_to_odoo(
+    file: UploadFile = File(...),
+    allow_fuzzy: bool = Query(False),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Create the sale.order for the sheet's CRM lead directly in Odoo instead
+    of returning a file to import. Rows that fail expansion are reported
+    back and left out, as they are from the Success sheet; that includes
+    finishes that only matched a colour approximately, unless `allow_fuzzy`
+    is set, so a guessed colour code never reaches Odoo unreviewed.
+
+    The order's `origin` names the upload; pushing the same file again, with
+    the same `allow_fuzzy`, returns the order created the first time, with
+    `created` false.
+    """
+    contents = await read_upload(file)
+    origin   = f"Infurnia upload {hashlib.sha256(contents).hexdigest()[:16]}"
+    if allow_fuzzy:
+        origin += " (fuzzy)"
+    if origin in _pushes_in_flight:
+        raise HTTPException(status_code=409, detail="This file is already being pushed")
+    _pushes_in_flight.add(origin)
     try:
-        for i, row in raw_df.iterrows():
-            for j, cell in enumerate(row):
-                if str(cell).strip() == "Service Charges":
-                    header_row  = raw_df.iloc[i + 1]
-                    qty_col_idx = None
-                    for col_idx, col_val in enumerate(header_row):
-                        if str(col_val).strip() == "Quantity":
-                            qty_col_idx = col_idx
-                            break
-                    if qty_col_idx is not None:
-                        data_row = raw_df.iloc[i + 2]
-                        raw_qty  = data_row.iloc[qty_col_idx]
-                        match    = re.search(r"[\d.]+", str(raw_qty))
-                        if match:
-                            service_charge_qty = float(match.group())
-                    break
-            if service_charge_qty is not None:
-                break
-    except Exception as e:
-        print(f"Could not extract Service Charges quantity: {e}")
-
-    # ── PRE-SCAN: collect all glass-shutter model rows present in this sheet ──
-    # Glass-shutter rows can appear ANYWHERE — before, between, or after the
-    # MK-prelam rows they describe. Scan once upfront; main loop skips them.
-    glass_shutter_found = []
-    for _, scan_row in df.iterrows():
-        m = normalize_text(scan_row["Model"])
-        if is_glass_shutter_model(m) and m not in glass_shutter_found:
-            glass_shutter_found.append(m)
-
-    print(f"Glass-shutter models found in sheet: {glass_shutter_found}")
-
-    # ── Helpers ───────────────────────────────────────────────────────────────
-
-    def get_colour_code(db, finish, model, index, reference, failed_rows):
-        colour = db.query(ColorCode).filter(ColorCode.colour_name == finish).first()
-        if not colour:
-            failed_rows.append({
-                "Row": index + 1,
-                "Model": model,
-                "Cabinet Position": reference,
-                "Reason": f"Cabinet processed but could not find colour '{finish}'"
-            })
-            return None
-        return colour.colour_code
-
-    def get_odoo_code(db, model, index, reference, failed_rows):
-        mapping = db.query(CodeRaw).filter(CodeRaw.infurnia_code == model).first()
-        if not mapping:
-            failed_rows.append({
-                "Row": index + 1,
-                "Model": model,
-                "Cabinet Position": reference,
-                "Reason": f"No mapping found in code_raw for model '{model}'"
-            })
-            return None
-        return mapping.odoo_code
-
-    # ── Condition Processors ──────────────────────────────────────────────────
-
-    def process_mk_model(db, model, finish, quantity, index, reference,
-                         failed_rows, results, customer_meta=None):
-        cabinet = db.query(Cabinet).filter(Cabinet.cabinet_code == model).first()
-        if not cabinet:
-            failed_rows.append({
-                "Row": index + 1, "Model": model,
-                "Cabinet Position": reference,
-                "Reason": "Cabinet not found in DB"
+        quotation = await parse_workbook(contents)
+        version   = await catalogue_version_async(db)
+        order     = await expand_upload(quotation, db, version, allow_fuzzy=allow_fuzzy)
+
+        lines = list(order.results.rows(LINE_COLUMNS))
+        if not lines:
+            raise HTTPException(status_code=422, detail="No order lines to push")
+
+        crm_id = quotation.project_id
+        print(f"Creating sale order for CRM ID {crm_id} with {len(lines)} lines")
+        try:
+            sale_order_id, created = await odoo.create_sale_order_async(crm_id, lines, origin)
+        except odoo.SaleOrderPushError as e:
+            raise HTTPException(status_code=422, detail={
+                "message":          e.detail,
+                "missing_products": e.missing_products,
             })
-            return False
-
-        first_row = {
-            "Order Lines/Product":      model,
-            # MK cabinet row: description is just the model code (no brackets).
-            # Prelam rows will have this overwritten in the post-loop patch.
-            "Order Lines/Description":  model,
-            "Cabinet Position":         reference,
-            "Order Lines / Quantity":   quantity,
-        }
-        if customer_meta:
-            first_row.update(customer_meta)
-
-        results.append(first_row)
-
-        # Prelam finishes are glass profiles — skip BOM colour lookup entirely.
-        # The description will be patched after the main loop.
-        if finish in PRELAM_FINISHES:
-            return True
-
-        colour_code = get_colour_code(db, finish, model, index, reference, failed_rows)
-        if not colour_code:
-            return True
-
-        for bom in [cabinet.bom_line_1, cabinet.bom_line_2,
-                    cabinet.bom_line_3, cabinet.bom_line_4]:
-            if bom:
-                product = f"{bom}-{colour_code}"
-                results.append({
-                    "Order Lines/Product":      product,
-                    # BOM line: [product_code] (finish_name)
-                    "Order Lines/Description":  f"[{product}] ({finish})",
-                    "Cabinet Position":         reference,
-                    "Order Lines / Quantity":   quantity,
-                })
-        return True
-    
-
-    _P_FIL_MODELS = {"P1725-AA", "P1724-AA", "P1723-AA", "P1722-AA"}
-
-    def process_fil_model(db, model, finish, quantity, index, reference, failed_rows, results):
-        colour_code = get_colour_code(db, finish, model, index, reference, failed_rows)
-        if not colour_code:
-            return False
-
-        product = f"{model}-{colour_code}"
-        results.append({
-            "Order Lines/Product":      product,
-            # FIL / EP line: [product_code] (finish_name)
-            "Order Lines/Description":  f"[{product}] ({finish})",
-            "Cabinet Position":         reference,
-            "Order Lines / Quantity":   quantity,
-        })
-        return True
-
-    def process_generic_model(db, model, quantity, index, reference, failed_rows, results):
-        odoo_code = get_odoo_code(db, model, index, reference, failed_rows)
-        if not odoo_code:
-            return False
-
-        results.append({
-            "Order Lines/Product":      odoo_code,
-            # Generic row: [product_code] — no finish
-            "Order Lines/Description":  f"[{odoo_code}]",
-            "Cabinet Position":         reference,
-            "Order Lines / Quantity":   quantity,
-        })
-        return True
-
-    def process_row(db, model, finish, quantity, index, reference,
-                    failed_rows, results, customer_meta):
-        """Route to the correct handler based on model prefix."""
-        if model.startswith("MK-"):
-            return process_mk_model(db, model, finish, quantity, index, reference,
-                                    failed_rows, results, customer_meta)
-        elif model.startswith("FIL-"):
-            return process_fil_model(db, model, finish, quantity, index, reference,
-                                     failed_rows, results)
-        elif model.startswith("EP-"):
-            return process_fil_model(db, model, finish, quantity, index, reference,
-                                     failed_rows, results)
-        
-
-        elif model in _P_FIL_MODELS:                          # ← new branch
-            success = process_fil_model(db, model, finish, quantity, index, reference,
-                                    failed_rows, results)
-            if success:                                        # only append if FIL succeeded
-                results.append({
-                    "Order Lines/Product":     "M-CF-217",
-                    "Order Lines/Description": "[M-CF-217]",
-                    "Cabinet Position":        reference,
-                    "Order Lines / Quantity":  quantity,
-                })
-            return success
+    finally:
+        _pushes_in_flight.discard(origin)
+    if not created:
+        print(f"Sale order {sale_order_id} already exists for this upload")
+
+    return {
+        "sale_order_id": sale_order_id,
+        "created":       created,
+        "crm_id":        crm_id,
+        "lines":         len(lines),
+        "failed_rows":   failed_rows_json(order),
+    }
+
+
+# ── Jobs ──────────────────────────────────────────────────────────────────────
+# The /process-xlsx pipeline run in the background, for workbooks too large
+# to wait on: submit returns a job ID at once and the output is fetched later.
+
+async def run_process_job(contents: bytes, output_format: str, sheet: str, allow_fuzzy: bool):
+    async with AsyncSessionLocal() as db:
+        version           = await catalogue_version_async(db)
+        cache_key, cached = await cached_output(contents, version, allow_fuzzy, output_format,
+                                                sheet)
+        if cached is not None:
+            return cached
+        quotation = await parse_workbook(contents)
+        order, project_name, customer, poc = await expand_with_crm(quotation, db, version,
+                                                                   allow_fuzzy=allow_fuzzy)
+    if cache_key is not None:
+        await cache_snapshot(contents, version, allow_fuzzy, quotation, order)
+    data = await run_cpu_bound(render_sales_order, order, project_name, customer, poc,
+                               output_format, sheet)
+    await asyncio.to_thread(result_cache.put, cache_key, data)
+    return data
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    output_format: str = Query("xlsx", alias="format"),
+    sheet: str = Query("Success"),
+    allow_fuzzy: bool = Query(False),
+):
+    """Queue a workbook for /process-xlsx processing; takes the same parameters."""
+    output_format = check_output_format(output_format, sheet)
+    contents      = await read_upload(file)
+    try:
+        job = job_queue.submit(run_process_job, contents, output_format, sheet, allow_fuzzy,
+                               meta={"filename": file.filename, "format": output_format})
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.summary()
+
+
+def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return get_job(job_id).summary()
+
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = get_job(job_id)
+    if job.status == FAILED:
+        raise HTTPException(status_code=job.error_status, detail=job.error)
+    if job.status != DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    output_format = job.meta["format"]
+    return Response(job.result, media_type=MEDIA_TYPES[output_format],
+                    headers=download_headers(output_format))
+
+
+# ── Batch ─────────────────────────────────────────────────────────────────────
+
+@app.post("/process-batch")
+async def process_batch(
+    files: list[UploadFile] = File(...),
+    output_format: str = Query("xlsx", alias="format"),
+    sheet: str = Query("Success"),
+    allow_fuzzy: bool = Query(False),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Many quotations in one request, as .xlsx files and/or .zip archives of
+    them. Returns a zip with one output per quotation (same `format`, `sheet`
+    and `allow_fuzzy` as /process-xlsx) and failures.csv: the failed rows of
+    every file, plus the files that could not be read at all.
+    """
+    output_format = check_output_format(output_format, sheet)
+    try:
+        uploads = unpack_uploads([(f.filename, await f.read()) for f in files])
+    except BatchError as e:
+        raise HTTPException(status_code=400, detail=e.detail)
+    print(f"Processing batch of {len(uploads)} quotations")
+
+    # Every stage fans the files out across the worker pool at once
+    parsed = await asyncio.gather(
+        *(run_cpu_bound(parse_quotation, contents) for _, contents in uploads),
+        return_exceptions=True,
+    )
+    failures   = []
+    quotations = []
+    for (name, _), result in zip(uploads, parsed):
+        if isinstance(result, QuotationError):
+            failures.append((name, None, None, None, result.detail))
+        elif isinstance(result, BaseException):
+            raise result
         else:
-            return process_generic_model(db, model, quantity, index, reference,
-                                         failed_rows, results)
-
-    # ── Main loop ─────────────────────────────────────────────────────────────
-    customer_written = False
-    prelam_pending   = []  # [{result_idx, finish, mk_product, row, reference}]
-
-    for index, row in df.iterrows():
-        model     = normalize_text(row["Model"])
-        finish    = normalize_text(row["Shutter_Finish"])
-        reference = row["Reference"]
-        quantity  = row["Quantity"]
-
-        if not model:
-            continue
-
-        # Glass-shutter rows produce no output — handled via pre-scan + post-loop
-        if is_glass_shutter_model(model):
-            continue
-
-        # Standard finish-missing validation
-        if model.startswith(("MK-", "FIL-", "EP-")) and not finish:
-            failed_rows.append({
-                "Row": index + 1, "Model": model,
-                "Cabinet Position": reference, "Reason": "Finish missing"
-            })
-            continue
-
-        customer_meta = None
-        if not customer_written:
-            customer_meta = {
-                "Customer":      customer or "Default Customer",
-                "GST Treatment": "Consumer",
-                "POC":           poc or "Default POC",
-                "Tag":           "Product",
-                "Project Name":  project_name or "Default Project Name",
-            }
-
-        before_idx = len(results)
-        success = process_row(db, model, finish, quantity, index, reference,
-                              failed_rows, results, customer_meta)
-
-        if success and not customer_written:
-            customer_written = True
-
-        # Track MK-prelam rows for post-loop description patch
-        if success and model.startswith("MK-") and finish in PRELAM_FINISHES:
-            prelam_pending.append({
-                "result_idx": before_idx,
-                "finish":     finish,
-                "mk_product": results[before_idx]["Order Lines/Product"],
-                "row":        index + 1,
-                "reference":  reference,
-            })
+            quotations.append((name, result))
 
-    # ── POST-LOOP: patch 3-line glass description onto every MK-prelam row ────
-    # All prelam rows in the sheet share the same single glass-shutter model.
-    if prelam_pending:
-        if not glass_shutter_found:
-            for item in prelam_pending:
-                failed_rows.append({
-                    "Row":              item["row"],
-                    "Model":            item["mk_product"],
-                    "Cabinet Position": item["reference"],
-                    "Reason":           "Prelam finish found but no glass-shutter profile model row exists in the sheet",
-                })
-        else:
-            glass_model = glass_shutter_found[0]  # one model shared by all prelam rows
-            for item in prelam_pending:
-                results[item["result_idx"]]["Order Lines/Description"] = (
-                    build_glass_shutter_description(
-                        item["mk_product"], glass_model, item["finish"]
-                    )
-                )
-
-    # ── Service charge row ────────────────────────────────────────────────────
-    if service_charge_qty is not None:
-        results.append({
-            "Cabinet Position":         "B2C Installation Service",
-            "Order Lines/Product":      "SR-0001",
-            "Order Lines/Description":  "[SR-0001]",
-            "Order Lines / Quantity":   service_charge_qty,
-        })
-    else:
-        print("Service charge quantity not found; skipping SR-0001 row.")
-
-    # ── Build output workbook ─────────────────────────────────────────────────
-    output = io.BytesIO()
-
-    COLUMN_ORDER = [
-        "Customer",
-        "GST Treatment",
-        "POC",
-        "Cabinet Position",
-        "Tag",
-        "Project Name",
-        "Order Lines/Product",
-        "Order Lines/Description",
-        "Order Lines / Quantity",
-    ]
-
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        if results:
-            pd.DataFrame(results, columns=COLUMN_ORDER).to_excel(
-                writer, sheet_name="Success", index=False
-            )
-        if failed_rows:
-            pd.DataFrame(failed_rows).to_excel(
-                writer, sheet_name="Failed", index=False
+    outputs = []
+    if quotations:
+        # One search_read for all the batch's leads, alongside the expansion
+        crm_task = asyncio.create_task(
+            odoo.get_customer_pocs_async({q.project_id for _, q in quotations}))
+        try:
+            lookups = await resolve_lookups_async(
+                db,
+                set().union(*(q.models for _, q in quotations)),
+                set().union(*(q.finishes for _, q in quotations)),
+                allow_fuzzy,
             )
-
-    output.seek(0)
-
-    return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": 'attachment; filename="processed_output.xlsx"'}
-    )
\ No newline at end of file
+            orders = await asyncio.gather(*(
+                run_cpu_bound(expand_quotation, q,
+                              lookups.subset(q.models, q.finishes, allow_fuzzy))
+                for _, q in quotations
+            ))
+        except BaseException:
+            crm_task.cancel()
+            raise
+        crm = await crm_task
+
+        rendered = await asyncio.gather(*(
+            run_cpu_bound(render_sales_order, order, *crm[q.project_id], output_format, sheet)
+            for (_, q), order in zip(quotations, orders)
+        ), return_exceptions=True)
+        for (name, _), order, data in zip(quotations, orders, rendered):
+            # A file whose output cannot be written is reported, not fatal
+            if isinstance(data, ValueError):
+                failures.append((name, None, None, None, f"Could not write output: {data}"))
+                continue
+            if isinstance(data, BaseException):
+                raise data
+            outputs.append((name, output_format, data))
+            failures.extend((name, *row) for row in order.failed_rows.rows())
+
+    archive = await asyncio.to_thread(pack_outputs, outputs, failures)
+    return Response(
+        archive,
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="processed_batch.zip"'}
+    )
+
+
+# ── Catalogue admin ───────────────────────────────────────────────────────────
+# Bulk replacement of the catalogue tables, see catalogue_loader.py.
+
+def require_admin(x_admin_token: str | None = Header(None)):
+    check_token(x_admin_token, ADMIN_API_TOKEN, "Admin endpoints are disabled; set ADMIN_API_TOKEN")
+
+
+@app.post("/admin/catalogue/{table}", dependencies=[Depends(require_admin)])
+async def load_catalogue_table(table: str, file: UploadFile = File(...)):
+    """
+    Replace `colorcode`, `code_raw` or `cabinets` (with its BOM lines) from a
+    .csv or .xlsx file, in one transaction.
+    """
+    if table not in TABLE_COLUMNS:
+        raise HTTPException(status_code=404, detail=f"Unknown catalogue table {table!r}")
+    contents = await file.read()
+    try:
+        result = await asyncio.to_thread(load_catalogue, table, file.filename, contents)
+    except CatalogueError as e:
+        raise HTTPException(status_code=400, detail=e.detail)
+    # Other processes notice the new catalogue_version on their next check
+    lookup_cache.invalidate()
+    return result
+
+
+@app.get("/admin/catalogue/version", dependencies=[Depends(require_admin)])
+async def catalogue_version():
+    row = await asyncio.to_thread(current_version)
+    if row is None:
+        raise HTTPException(status_code=404, detail="catalogue_version is empty; run migrations.py")
+    return {"version": row.version, "updated_at": row.updated_at}
@@ -0,0 +1,34 @@
+"""
+Bounded memo for pure functions that the same keys hit again and again:
+model routing, fuzzy finish matching and MK BOM expansion.
+"""
+
+_MISSING = object()
+
+
+class BoundedMemo:
+    """
+    `fn(key)` remembered per key, for at most `size` keys. When full it
+    starts over instead of tracking recency, so a hit stays one dict lookup.
+    """
+
+    __slots__ = ("fn", "size", "_entries")
+
+    def __init__(self, fn, size: int):
+        self.fn       = fn
+        self.size     = size
+        self._entries = {}
+
+    def __call__(self, key):
+        value = self._entries.get(key, _MISSING)
+        if value is _MISSING:
+            if len(self._entries) >= self.size:
+                self._entries.clear()
+            value = self._entries[key] = self.fn(key)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
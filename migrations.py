@@ -0,0 +1,166 @@
+"""
+Versioned schema migrations for the catalogue tables.
+
+    python migrations.py            apply every pending migration
+    python migrations.py --status   list migrations and whether they ran
+
+Applied versions are recorded in `schema_version`. Each migration runs in
+its own transaction together with the insert of its version row, so it is
+either applied and recorded or not at all, and a second process running
+the same migration concurrently fails on the version's primary key
+instead of applying it twice.
+
+Migrations define the tables they need themselves instead of importing
+models.py, so they keep working however the models change later.
+"""
+import argparse
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import (
+    BigInteger, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, UniqueConstraint,
+    insert, inspect, select, text,
+)
+
+from database import engine
+
+_meta = MetaData()
+
+schema_version = Table(
+    "schema_version", _meta,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+class MigrationError(Exception):
+    pass
+
+
+# ── Migrations ────────────────────────────────────────────────────────────────
+
+def _fail_on_duplicates(conn, table: str, column: str):
+    duplicates = conn.execute(text(
+        f"SELECT {column}, COUNT(*) FROM {table} WHERE {column} IS NOT NULL "
+        f"GROUP BY {column} HAVING COUNT(*) > 1 ORDER BY {column}"
+    )).all()
+    if duplicates:
+        listed = ", ".join(f"{value!r} ({count} rows)" for value, count in duplicates[:20])
+        raise MigrationError(
+            f"{table}.{column} has duplicate values, remove them before migrating: {listed}"
+            + (f" and {len(duplicates) - 20} more" if len(duplicates) > 20 else "")
+        )
+
+
+def lookup_key_indexes(conn):
+    # Only the lowest-id row of a duplicated key was ever read, but which
+    # copy to keep is for a person to decide, not a migration
+    _fail_on_duplicates(conn, "cabinets", "cabinet_code")
+    _fail_on_duplicates(conn, "colorcode", "colour_name")
+    conn.execute(text("CREATE UNIQUE INDEX ux_cabinets_cabinet_code ON cabinets (cabinet_code)"))
+    conn.execute(text("CREATE UNIQUE INDEX ux_colorcode_colour_name ON colorcode (colour_name)"))
+    # Several Infurnia codes may share an Odoo product, so not unique
+    conn.execute(text("CREATE INDEX ix_code_raw_odoo_code ON code_raw (odoo_code)"))
+
+
+BOM_COLUMNS = ("bom_line_1", "bom_line_2", "bom_line_3", "bom_line_4")
+
+
+def cabinet_bom_table(conn):
+    meta = MetaData()
+    Table("cabinets", meta, Column("id", Integer, primary_key=True))  # for the foreign key
+    cabinet_bom = Table(
+        "cabinet_bom", meta,
+        Column("id", Integer, primary_key=True),
+        Column("cabinet_id", Integer, ForeignKey("cabinets.id", ondelete="CASCADE"), nullable=False),
+        Column("ordinal", Integer, nullable=False),
+        Column("product_code", String, nullable=False),
+        UniqueConstraint("cabinet_id", "ordinal", name="ux_cabinet_bom_cabinet_ordinal"),
+    )
+    # The unique constraint's index serves the (cabinet_id, ordinal) lookup join
+    cabinet_bom.create(conn)
+
+    # bom_line_N becomes ordinal N; empty columns get no row
+    for ordinal, column in enumerate(BOM_COLUMNS, start=1):
+        conn.execute(text(
+            f"INSERT INTO cabinet_bom (cabinet_id, ordinal, product_code) "
+            f"SELECT id, {ordinal}, {column} FROM cabinets "
+            f"WHERE {column} IS NOT NULL AND {column} <> ''"
+        ))
+    for column in BOM_COLUMNS:
+        conn.execute(text(f"ALTER TABLE cabinets DROP COLUMN {column}"))
+
+
+def catalogue_version_table(conn):
+    Table(
+        "catalogue_version", MetaData(),
+        Column("id", Integer, primary_key=True, autoincrement=False),  # always 1
+        Column("version", BigInteger, nullable=False),
+        Column("updated_at", DateTime(timezone=True), nullable=False),
+    ).create(conn)
+    conn.execute(text(
+        "INSERT INTO catalogue_version (id, version, updated_at) VALUES (1, 1, :now)"
+    ), {"now": datetime.now(timezone.utc)})
+
+
+MIGRATIONS = [
+    (1, "Unique indexes on cabinets.cabinet_code and colorcode.colour_name, "
+        "index on code_raw.odoo_code", lookup_key_indexes),
+    (2, "Move cabinets.bom_line_1..4 into the cabinet_bom child table", cabinet_bom_table),
+    (3, "catalogue_version row, bumped by every bulk catalogue load", catalogue_version_table),
+]
+
+
+# ── Runner ────────────────────────────────────────────────────────────────────
+
+def applied_versions(conn) -> set:
+    if not inspect(conn).has_table("schema_version"):
+        return set()
+    return set(conn.execute(select(schema_version.c.version)).scalars())
+
+
+def migrate(bind=engine) -> list:
+    """Apply pending migrations in order; returns the versions applied."""
+    with bind.begin() as conn:
+        schema_version.create(conn, checkfirst=True)
+        done = applied_versions(conn)
+
+    applied = []
+    for version, description, upgrade in MIGRATIONS:
+        if version in done:
+            continue
+        print(f"Applying migration {version}: {description}")
+        with bind.begin() as conn:
+            upgrade(conn)
+            conn.execute(insert(schema_version).values(
+                version=version, description=description,
+                applied_at=datetime.now(timezone.utc),
+            ))
+        applied.append(version)
+    return applied
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Apply catalogue schema migrations.")
+    parser.add_argument("--status", action="store_true", help="list migrations without applying them")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        with engine.connect() as conn:
+            done = applied_versions(conn)
+        for version, description, _ in MIGRATIONS:
+            print(f"{'applied' if version in done else 'pending'}  {version}  {description}")
+        return 0
+
+    try:
+        applied = migrate()
+    except MigrationError as e:
+        print(f"Migration failed: {e}")
+        return 1
+    print(f"Applied {len(applied)} migrations" if applied else "Schema is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
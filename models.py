@@ -1,22 +1,32 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, ForeignKey, Integer, String, UniqueConstraint
 from database import Base
 
+# Schema changes go through migrations.py
+
 class Cabinet(Base):
     __tablename__ = "cabinets"
 
     id = Column(Integer, primary_key=True, index=True)
-    cabinet_code = Column(String)
-    bom_line_1 = Column(String)
-    bom_line_2 = Column(String)
-    bom_line_3 = Column(String)
-    bom_line_4 = Column(String)   # ✅ new column added
+    cabinet_code = Column(String, unique=True)
+
+
+class CabinetBom(Base):
+    __tablename__ = "cabinet_bom"
+    __table_args__ = (
+        UniqueConstraint("cabinet_id", "ordinal", name="ux_cabinet_bom_cabinet_ordinal"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    cabinet_id = Column(Integer, ForeignKey("cabinets.id", ondelete="CASCADE"), nullable=False)
+    ordinal = Column(Integer, nullable=False)          # position of the line in the BOM
+    product_code = Column(String, nullable=False)
 
 
 class ColorCode(Base):
     __tablename__ = "colorcode"
 
     id = Column(Integer, primary_key=True, index=True)
-    colour_name = Column(String)
+    colour_name = Column(String, unique=True)
     colour_code = Column(String)
 
 
@@ -24,5 +34,4 @@ class CodeRaw(Base):
     __tablename__ = "code_raw"
 
     infurnia_code = Column(String(50), primary_key=True)
-    odoo_code     = Column(String(50))
-
+    odoo_code     = Column(String(50), index=True)
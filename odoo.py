@@ -1,6 +1,13 @@
 import xmlrpc.client
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import httpx
 from dotenv import load_dotenv
 import os
+from errors import DetailError
 # Odoo connection details
 load_dotenv()
 
@@ -9,36 +16,185 @@ db       = os.getenv('ODOO_DB')
 username = os.getenv('ODOO_USERNAME')
 password = os.getenv('ODOO_PASSWORD')
 
-# Authenticate with Odoo
-common = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/common')
-uid = common.authenticate(db, username, password, {})
+ODOO_TIMEOUT = float(os.getenv('ODOO_TIMEOUT', '30'))
 
-if not uid:
-    raise Exception("Authentication failed")
+# Odoo answers a bad or expired login on /object with this fault code
+# (odoo.service.wsgi_server.RPC_FAULT_CODE_ACCESS_DENIED).
+_ACCESS_DENIED = 3
 
-print("✅ Authentication Success:", uid)
 
-# Create object proxy to interact with Odoo models
-models = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object')
+class OdooAuthError(Exception):
+    pass
 
-def get_customer_poc(crm_id):
+
+class OdooClient:
+    """
+    XML-RPC session against one Odoo database.
+
+    Nothing is sent until the first call: the uid is fetched on demand,
+    cached, and fetched again only when Odoo rejects it. Calls go through
+    pooled keep-alive httpx clients (one sync, one async) instead of a new
+    ServerProxy connection per call.
+    """
+
+    def __init__(self, url, db, username, password, timeout=ODOO_TIMEOUT):
+        self.url      = url
+        self.db       = db
+        self.username = username
+        self.password = password
+        self.timeout  = timeout
+        self._uid          = None
+        self._lock         = threading.Lock()
+        self._async_lock   = None
+        self._client       = None
+        self._async_client = None
+
+    # ── Transport ─────────────────────────────────────────────────────────────
+
+    def _client_kwargs(self):
+        return dict(base_url=self.url, timeout=self.timeout,
+                    headers={'Content-Type': 'text/xml'})
+
+    def _http(self):
+        if self._client is None:
+            self._client = httpx.Client(transport=httpx.HTTPTransport(retries=1),
+                                        **self._client_kwargs())
+        return self._client
+
+    def _async_http(self):
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(retries=1),
+                                                   **self._client_kwargs())
+        return self._async_client
+
+    @staticmethod
+    def _encode(method, params):
+        return xmlrpc.client.dumps(params, methodname=method, allow_none=True)
+
+    @staticmethod
+    def _decode(response):
+        """Raises xmlrpc.client.Fault on Odoo errors."""
+        response.raise_for_status()
+        (result,), _ = xmlrpc.client.loads(response.content, use_builtin_types=True)
+        return result
+
+    def _rpc(self, service, method, *params):
+        response = self._http().post(f'/xmlrpc/2/{service}', content=self._encode(method, params))
+        return self._decode(response)
+
+    async def _rpc_async(self, service, method, *params):
+        response = await self._async_http().post(f'/xmlrpc/2/{service}',
+                                                 content=self._encode(method, params))
+        return self._decode(response)
+
+    # ── Session ───────────────────────────────────────────────────────────────
+
+    def _accept_uid(self, uid):
+        if not uid:
+            raise OdooAuthError("Authentication failed")
+        print("✅ Authentication Success:", uid)
+        self._uid = uid
+        return uid
+
+    def authenticate(self):
+        """Cached uid, logging in first if there is none."""
+        with self._lock:
+            if self._uid is None:
+                self._accept_uid(self._rpc('common', 'authenticate',
+                                           self.db, self.username, self.password, {}))
+            return self._uid
+
+    async def authenticate_async(self):
+        if self._uid is not None:
+            return self._uid
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if self._uid is None:
+                self._accept_uid(await self._rpc_async('common', 'authenticate',
+                                                       self.db, self.username, self.password, {}))
+            return self._uid
+
+    def _drop_session(self, uid, fault):
+        """Forget `uid` if Odoo rejected it; True when the call is worth retrying."""
+        if fault.faultCode != _ACCESS_DENIED and 'AccessDenied' not in str(fault.faultString):
+            return False
+        print("Odoo rejected the session, authenticating again")
+        if self._uid == uid:
+            self._uid = None
+        return True
+
+    # ── Calls ─────────────────────────────────────────────────────────────────
+
+    def execute_kw(self, model, method, args, kwargs=None):
+        uid = self.authenticate()
+        try:
+            return self._rpc('object', 'execute_kw', self.db, uid, self.password,
+                             model, method, args, kwargs or {})
+        except xmlrpc.client.Fault as e:
+            if not self._drop_session(uid, e):
+                raise
+        return self._rpc('object', 'execute_kw', self.db, self.authenticate(), self.password,
+                         model, method, args, kwargs or {})
+
+    async def execute_kw_async(self, model, method, args, kwargs=None):
+        uid = await self.authenticate_async()
+        try:
+            return await self._rpc_async('object', 'execute_kw', self.db, uid, self.password,
+                                         model, method, args, kwargs or {})
+        except xmlrpc.client.Fault as e:
+            if not self._drop_session(uid, e):
+                raise
+        return await self._rpc_async('object', 'execute_kw', self.db,
+                                     await self.authenticate_async(), self.password,
+                                     model, method, args, kwargs or {})
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+client = OdooClient(url, db, username, password)
+
+def execute_kw(model, method, args, kwargs=None):
+    return client.execute_kw(model, method, args, kwargs)
+
+async def execute_kw_async(model, method, args, kwargs=None):
+    return await client.execute_kw_async(model, method, args, kwargs)
+
+async def aclose():
+    await client.aclose()
+
+
+CRM_LEAD_FIELDS = ['id',
+    'name',
+    # 'phone',
+    'partner_id',
+    'x_studio_sales_poc_1',
+    # 'x_studio_sales_poc_mob_no_1',
+    # 'x_studio_installation_poc_no_1',
+    # 'x_studio_supervisor_1'
+    ]
+
+def _fetch_customer_poc(crm_id):
     """
     Fetches the customer and POC (Point of Contact) from Odoo using the crm_id.
     """
-    customer_data = models.execute_kw(db, uid, password,
-                                      'crm.lead', 'search_read',
-                                      [
+    customer_data = execute_kw('crm.lead', 'search_read',
+                               [
           [['id', '=', crm_id]]
-        ], {'fields': ['id', 
-            'name', 
-            # 'phone',
-            'partner_id',
-            'x_studio_sales_poc_1',           
-            # 'x_studio_sales_poc_mob_no_1',    
-            # 'x_studio_installation_poc_no_1', 
-            # 'x_studio_supervisor_1' 
-            ]})
-    
+        ], {'fields': CRM_LEAD_FIELDS})
+    return _customer_poc_from_leads(customer_data)
+
+
+def _customer_poc_from_leads(customer_data):
     if not customer_data:
         return None, None, None
 
@@ -57,3 +213,238 @@ def get_customer_poc(crm_id):
     # print(f"Fetched from Odoo - Project Name: {project_name}, Customer: {customer}, POC: {poc}")
     
     return project_name, customer, poc
+
+
+async def _fetch_customer_poc_async(crm_id):
+    """Async `_fetch_customer_poc`."""
+    customer_data = await execute_kw_async('crm.lead', 'search_read',
+                                           [[['id', '=', crm_id]]],
+                                           {'fields': CRM_LEAD_FIELDS})
+    return _customer_poc_from_leads(customer_data)
+
+
+async def _fetch_customer_pocs_async(crm_ids):
+    """(project_name, customer, poc) per CRM ID for several leads in one search_read."""
+    leads = await execute_kw_async('crm.lead', 'search_read',
+                                   [[['id', 'in', [int(crm_id) for crm_id in crm_ids]]]],
+                                   {'fields': CRM_LEAD_FIELDS})
+    return {crm_key(lead['id']): _customer_poc_from_leads([lead]) for lead in leads}
+
+
+# ── CRM lead cache ────────────────────────────────────────────────────────────
+# Revisions of one quotation are uploaded back to back and all carry the same
+# CRM ID, so the lead is served from memory instead of asking Odoo each time.
+
+CRM_CACHE_TTL  = float(os.getenv('CRM_CACHE_TTL', '300'))
+CRM_CACHE_SIZE = int(os.getenv('CRM_CACHE_SIZE', '256'))
+
+def crm_key(crm_id):
+    """One spelling per CRM ID, so "0123", "123.0" and 123 share a cache entry."""
+    text = str(crm_id).strip()
+    number = text[:-2] if text.endswith('.0') else text
+    return str(int(number)) if number.isdigit() else text
+
+class CrmLeadCache:
+    """
+    (project_name, customer, poc) per CRM ID, kept for CRM_CACHE_TTL seconds
+    and evicted least-recently-used past CRM_CACHE_SIZE entries. A caller
+    asking for an ID that is already being fetched waits for that fetch
+    instead of sending its own. Missing leads and errors are not cached.
+    """
+
+    def __init__(self, ttl=CRM_CACHE_TTL, size=CRM_CACHE_SIZE):
+        self.ttl            = ttl
+        self.size           = size
+        self._entries       = OrderedDict()  # crm_id -> (expires_at, value)
+        self._lock          = threading.Lock()
+        self._pending       = {}             # crm_id -> Future, sync callers
+        self._pending_async = {}             # crm_id -> Task, async callers
+
+    def _lookup(self, key):
+        # Caller holds self._lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key, value):
+        # Caller holds self._lock
+        if value[0] is None:
+            return  # no lead (yet) — ask Odoo again next time
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def get(self, crm_id, fetch):
+        key = crm_key(crm_id)
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            future = self._pending.get(key)
+            owner  = future is None
+            if owner:
+                future = self._pending[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            value = fetch(crm_id)
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._store(key, value)
+            del self._pending[key]
+        future.set_result(value)
+        return value
+
+    async def get_async(self, crm_id, fetch):
+        key = crm_key(crm_id)
+        with self._lock:
+            value = self._lookup(key)
+        if value is not None:
+            return value
+
+        # The fetch runs as its own task, so a cancelled caller does not take
+        # the shared call down with it.
+        task = self._pending_async.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch(crm_id))
+            self._pending_async[key] = task
+            task.add_done_callback(lambda t: self._finish_async(key, t))
+        return await asyncio.shield(task)
+
+    async def get_many_async(self, crm_ids, fetch_many):
+        """
+        Values keyed by the IDs as given. IDs not in the cache are fetched
+        together with one `fetch_many(keys)` call, which returns a dict keyed
+        by crm_key.
+        """
+        crm_ids = list(crm_ids)
+        keys    = list(dict.fromkeys(crm_key(crm_id) for crm_id in crm_ids))
+        values = {}
+        with self._lock:
+            for key in keys:
+                value = self._lookup(key)
+                if value is not None:
+                    values[key] = value
+        missing = [key for key in keys if key not in values]
+        if missing:
+            fetched = await fetch_many(missing)
+            with self._lock:
+                for key in missing:
+                    values[key] = fetched.get(key, (None, None, None))
+                    self._store(key, values[key])
+        return {crm_id: values[crm_key(crm_id)] for crm_id in crm_ids}
+
+    def _finish_async(self, key, task):
+        self._pending_async.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            with self._lock:
+                self._store(key, task.result())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+crm_cache = CrmLeadCache()
+
+def get_customer_poc(crm_id):
+    """(project_name, customer, poc) for a CRM lead, cached per CRM ID."""
+    return crm_cache.get(crm_id, _fetch_customer_poc)
+
+async def get_customer_poc_async(crm_id):
+    """Async `get_customer_poc`; shares the cache with the sync path."""
+    return await crm_cache.get_async(crm_id, _fetch_customer_poc_async)
+
+async def get_customer_pocs_async(crm_ids):
+    """`get_customer_poc_async` for several CRM IDs with a single Odoo call, keyed by the IDs as given."""
+    return await crm_cache.get_many_async(crm_ids, _fetch_customer_pocs_async)
+
+
+# ── Sales order push ──────────────────────────────────────────────────────────
+# Creates the sale.order with all of its lines in four calls, however long
+# the order is: a search for an order already pushed from the same upload,
+# one product search over every distinct code and one lookup of the lead's
+# customer, all three at once, then one create carrying the lines as
+# (0, 0, vals) commands. The upload is recorded in the order's `origin`, so
+# pushing it again returns that order instead of creating a second one.
+
+# Optional sale.order.line field that receives the cabinet position
+ODOO_LINE_POSITION_FIELD = os.getenv('ODOO_LINE_POSITION_FIELD')
+
+class SaleOrderPushError(DetailError):
+    """The order cannot be created; nothing was written to Odoo."""
+
+    def __init__(self, detail, missing_products=()):
+        super().__init__(detail)
+        self.missing_products = list(missing_products)
+
+def _product_search_args(codes):
+    return [[['default_code', 'in', codes]]], {'fields': ['id', 'default_code']}
+
+def _existing_order_args(crm_id, origin):
+    # A cancelled order does not count, so it can be pushed again
+    return [[['opportunity_id', '=', int(crm_id)], ['origin', '=', origin],
+             ['state', '!=', 'cancel']]], {'fields': ['id'], 'limit': 1}
+
+def _lead_partner_args(crm_id):
+    # search_read, not read: a missing lead gives [] instead of a fault
+    return [[['id', '=', int(crm_id)]]], {'fields': ['partner_id']}
+
+def _sale_order_values(crm_id, origin, leads, products, lines, codes):
+    """`sale.order` create values, or SaleOrderPushError if something is missing."""
+    if not leads or not leads[0].get('partner_id'):
+        raise SaleOrderPushError(f"CRM lead {crm_id} not found or has no customer")
+
+    product_ids = {}
+    for product in products:
+        product_ids.setdefault(product['default_code'], product['id'])
+    missing = [code for code in codes if code not in product_ids]
+    if missing:
+        raise SaleOrderPushError("Products not found in Odoo", missing)
+
+    order_lines = []
+    for product, description, position, quantity in lines:
+        vals = {
+            'product_id':      product_ids[product],
+            'name':            description,
+            'product_uom_qty': quantity,
+        }
+        if ODOO_LINE_POSITION_FIELD and position:
+            vals[ODOO_LINE_POSITION_FIELD] = position
+        order_lines.append((0, 0, vals))
+
+    return {
+        'partner_id':     leads[0]['partner_id'][0],
+        'opportunity_id': int(crm_id),
+        'origin':         origin,
+        'order_line':     order_lines,
+    }
+
+async def create_sale_order_async(crm_id, lines, origin):
+    """
+    Create a sale.order for the lead from (product_code, description,
+    cabinet_position, quantity) lines, unless one with the same `origin`
+    exists already. Returns (order id, whether it was created now).
+    """
+    codes = sorted({line[0] for line in lines})
+    existing, products, leads = await asyncio.gather(
+        execute_kw_async('sale.order', 'search_read', *_existing_order_args(crm_id, origin)),
+        execute_kw_async('product.product', 'search_read', *_product_search_args(codes)),
+        execute_kw_async('crm.lead', 'search_read', *_lead_partner_args(crm_id)),
+    )
+    if existing:
+        return existing[0]['id'], False
+    values = _sale_order_values(crm_id, origin, leads, products, lines, codes)
+    return await execute_kw_async('sale.order', 'create', [values]), True
@@ -0,0 +1,96 @@
+"""
+Encoders for the processed sales order, for clients that want the rows
+rather than a workbook. Each takes the (title, columns, rows) sheets from
+`pipeline.sales_order_sheets` and yields str/bytes chunks for a
+StreamingResponse:
+
+    xlsx    the workbook (default)
+    csv     one sheet, picked with `sheet`
+    ndjson  one JSON object per row, tagged with its sheet
+    json    {"Success": [{...}, ...], "Failed": [...]}
+"""
+import csv
+import io
+import json
+
+from xlsx_writer import iter_xlsx
+
+# Rows encoded between two yielded chunks
+_ROWS_PER_CHUNK = 500
+
+SHEET_NAMES = ("Success", "Failed")
+
+MEDIA_TYPES = {
+    "xlsx":   "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv":    "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "json":   "application/json",
+}
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _records(columns, rows):
+    for row in rows:
+        yield dict(zip(columns, row))
+
+
+def iter_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\r\n")
+    writer.writerow(columns)
+    for n, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if n % _ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(sheets):
+    lines = []
+    for title, columns, rows in sheets:
+        for record in _records(columns, rows):
+            lines.append(_dumps({"sheet": title, **record}))
+            if len(lines) == _ROWS_PER_CHUNK:
+                yield "\n".join(lines) + "\n"
+                lines.clear()
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def iter_json(sheets):
+    yield "{"
+    for i, (title, columns, rows) in enumerate(sheets):
+        yield ("," if i else "") + _dumps(title) + ":["
+        chunk = []
+        for n, record in enumerate(_records(columns, rows)):
+            chunk.append(("," if n else "") + _dumps(record))
+            if len(chunk) == _ROWS_PER_CHUNK:
+                yield "".join(chunk)
+                chunk.clear()
+        yield "".join(chunk) + "]"
+    yield "}"
+
+
+def encode_sheets(sheets, fmt: str, sheet: str | None = None):
+    """
+    Chunks of `sheets` in format `fmt`. For csv, `sheet` names the one sheet
+    to return (case-insensitive, default the first).
+    """
+    if fmt == "xlsx":
+        return iter_xlsx(sheets)
+    if fmt == "csv":
+        wanted = (sheet or sheets[0][0]).lower()
+        for title, columns, rows in sheets:
+            if title.lower() == wanted:
+                return iter_csv(columns, rows)
+        raise ValueError(f"No sheet named {sheet!r}")
+    if fmt == "ndjson":
+        return iter_ndjson(sheets)
+    if fmt == "json":
+        return iter_json(sheets)
+    raise ValueError(f"Unsupported output format: {fmt}")
@@ -0,0 +1,696 @@
+"""
+Quotation -> sales-order pipeline.
+
+The stages here do no database or Odoo I/O, so the FastAPI handler can run
+them in worker processes and keep the event loop free:
+
+    parse_quotation     xlsx bytes -> ParsedQuotation
+    expand_quotation    ParsedQuotation + Lookups -> SalesOrder
+    diff_rows           what changed between two expansions of a project
+    render_sales_order  SalesOrder + CRM details -> output bytes (xlsx by default)
+    stream_sales_order  the same output as a chunk iterator, xlsx or text formats
+"""
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from errors import DetailError
+from lookup_cache import Lookups
+from memo import BoundedMemo
+from result_buffer import ResultBuffer
+from routing import build_router
+from xlsx_reader import load_quotation_sheet
+from output_formats import encode_sheets
+from xlsx_writer import write_xlsx
+
+
+class QuotationError(DetailError):
+    """The uploaded workbook cannot be processed; `detail` is shown to the user."""
+
+
+# ── Utilities ─────────────────────────────────────────────────────────────────
+
+# Patterns are compiled once; the scalar helpers handle one value and the
+# column helpers below run the same logic over a whole Series in one pass.
+
+_QUANTITY_RE       = re.compile(r"[\d.]+")
+_MODEL_RE          = re.compile(r"Model:\s*(.+?)(?:\n|$)")
+_SHUTTER_FINISH_RE = re.compile(r"Shutter.*?Finish\s*:\s*(.+?)(?:\n|$)", re.DOTALL)
+_GENERIC_FINISH_RE = re.compile(r"Finish\s*:\s*(.+?)(?:\n|$)", re.DOTALL)
+
+
+def normalize_text(value):
+    if value is None or pd.isna(value):
+        return None
+    value = str(value).strip()
+    return value if value else None
+
+
+def compute_quantity(val):
+    try:
+        match = _QUANTITY_RE.search(str(val))
+        if not match:
+            return 1
+        q = float(match.group())
+        if q == 1:
+            return 1
+        return math.ceil(q / 3) + 1
+    except (ValueError, TypeError):
+        return 1
+
+
+# ── Mappings ──────────────────────────────────────────────────────────────────
+
+SHUTTER_FINISH_MAPPING = {
+    "Sandalwood":      "Courtyard Clay Gloss",
+    "Soundcloud":      "Mistfield Gloss",
+    "Washed Earth":    "Canyon Ridge Gloss",
+    "Starlight White": "Glacier Veil Gloss",
+    "Asteroid Belt":   "Industrial Bay Matte",
+}
+
+PRELAM_FINISHES = {
+    "Back Painted Fluted Glass Ivory Matt (Prelam)",
+    "Back Painted Fluted Glass Ash Matt (Prelam)",
+    "Back Painted Fluted Glass Biscuit Matt (Prelam)",
+    "Back Painted Fluted Glass Maple Bronze Gloss (Prelam)",
+    "Back Painted Frosted Glass Beige Matt (Prelam)",
+    "Back Painted Frosted Glass Graphite Matt (Prelam)",
+    "Back Painted Sandstone Gloss (Prelam)",
+    "Back Painted Pebble Gloss (Prelam)",
+    "Fluted Glass Vanilla Matt (Prelam)",
+    "Fluted Glass Coffee Matt (Prelam)",
+    "Fluted Glass Onyx Matt (Prelam)",
+    "Fluted Glass Snow Gloss (Prelam)",
+    "Fluted Glass Caramel Gloss (Prelam)",
+    "Fluted Glass Black Gloss (Prelam)",
+    "Sandwich Glass Bronze Veil (Prelam)",
+    "Frosted Glass Mist (Prelam)",
+}
+
+# Maps glass-shutter model codes -> human-readable profile description
+GLASS_SHUTTER_PROFILE_MAPPING = {
+    "KAPS-59 MB": "GLASS SHUTTER PROFILE: Matt Black ( KAPS-59 MB )",
+    "KAPS-59 MG": "GLASS SHUTTER PROFILE: Matt Gold ( KAPS-59 MG )",
+    "KAPS-59 SS": "GLASS SHUTTER PROFILE: Silver ( KAPS-59 SS )",
+    "SCP-06 MB":  "GLASS SHUTTER PROFILE: Matt Black ( SCP-06 MB )",
+    "SCP-06 MG":  "GLASS SHUTTER PROFILE: Matt Gold ( SCP-06 MG )",
+    "SCP-06 SS":  "GLASS SHUTTER PROFILE: Silver ( SCP-06 SS )",
+    "KSP-01 MB":  "GLASS SHUTTER PROFILE: Matt Black ( KSP-01 MB )",
+    "KSP-01 MG":  "GLASS SHUTTER PROFILE: Matt Gold ( KSP-01 MG )",
+    "KSP-01 SS":  "GLASS SHUTTER PROFILE: Silver ( KSP-01 SS )",
+    "BGK-01":     "GLASS SHUTTER PROFILE: Rose Gold 20 mm Profile",
+}
+
+GLASS_SHUTTER_MODELS = set(GLASS_SHUTTER_PROFILE_MAPPING.keys())
+
+
+# ── Extractors ────────────────────────────────────────────────────────────────
+
+def is_glass_shutter_model(model: str | None) -> bool:
+    return model in GLASS_SHUTTER_MODELS
+
+
+def extract_model(text: str | None):
+    if text is None or (isinstance(text, float) and pd.isna(text)):
+        return None
+    # Captures full model name until newline — handles "MK-0458" and "KSP-01 MG"
+    m = _MODEL_RE.search(str(text))
+    return m.group(1).strip() if m else None
+
+
+def extract_shutter_finish(text: str | None):
+    if text is None or (isinstance(text, float) and pd.isna(text)):
+        return None
+
+    s = str(text)
+
+    # Primary: "Shutter Finish : <value>"
+    m = _SHUTTER_FINISH_RE.search(s)
+    if m:
+        finish = m.group(1).strip()
+        return SHUTTER_FINISH_MAPPING.get(finish, finish)
+
+    # Fallback 1: cell directly contains a known Prelam finish string
+    s_stripped = s.strip()
+    if s_stripped in PRELAM_FINISHES:
+        return s_stripped
+
+    # Fallback 2: generic "Finish : <value>" without "Shutter" prefix
+    m2 = _GENERIC_FINISH_RE.search(s)
+    if m2:
+        finish = m2.group(1).strip()
+        return SHUTTER_FINISH_MAPPING.get(finish, finish)
+
+    return None
+
+
+def build_glass_shutter_description(mk_product: str, glass_model: str, prelam_finish: str) -> str:
+    """
+    3-line description for a glass-shutter MK-prelam row:
+        [MK-XXXX]
+        GLASS SHUTTER PROFILE: <profile label>
+        GLASS PROFILE: <prelam finish>
+    """
+    profile_label = GLASS_SHUTTER_PROFILE_MAPPING.get(glass_model, glass_model)
+    return f"[{mk_product}]\n{profile_label}\nGLASS PROFILE: {prelam_finish}"
+
+
+# ── Column helpers ────────────────────────────────────────────────────────────
+# Whole-column versions of the utilities and extractors above, giving exactly
+# the same values. Each is one pass over the column's Python objects with the
+# compiled pattern's bound method, instead of a Series.apply round trip and
+# a fresh re.search per cell.
+
+def _is_missing(value):
+    # pd.isna for scalars, minus the call: NaN and NaT are not equal to themselves
+    return value is None or value is pd.NA or value != value
+
+
+def _column(values: pd.Series, out: list) -> pd.Series:
+    return pd.Series(out, index=values.index)
+
+
+def normalize_texts(values: pd.Series) -> pd.Series:
+    out = []
+    for v in values.tolist():
+        v = None if _is_missing(v) else str(v).strip()
+        out.append(v or None)
+    return _column(values, out)
+
+
+def compute_quantities(values: pd.Series) -> pd.Series:
+    search = _QUANTITY_RE.search
+    out = []
+    for v in values.tolist():
+        m = search(str(v))
+        if not m:
+            out.append(1)
+            continue
+        try:
+            q = float(m.group())
+        except ValueError:  # runs such as ".." or "1.2.3"
+            out.append(1)
+            continue
+        out.append(1 if q == 1 else math.ceil(q / 3) + 1)
+    return _column(values, out)
+
+
+def extract_models(items: pd.Series) -> pd.Series:
+    search = _MODEL_RE.search
+    out = []
+    for v in items.tolist():
+        m = None if _is_missing(v) else search(str(v))
+        out.append(m.group(1).strip() if m else None)
+    return _column(items, out)
+
+
+def extract_shutter_finishes(finishes: pd.Series) -> pd.Series:
+    shutter, generic = _SHUTTER_FINISH_RE.search, _GENERIC_FINISH_RE.search
+    mapping = SHUTTER_FINISH_MAPPING
+    out = []
+    for v in finishes.tolist():
+        if _is_missing(v):
+            out.append(None)
+            continue
+        s = str(v)
+        m = shutter(s)
+        if not m:
+            stripped = s.strip()
+            if stripped in PRELAM_FINISHES:
+                out.append(stripped)
+                continue
+            m = generic(s)
+        if m:
+            finish = m.group(1).strip()
+            out.append(mapping.get(finish, finish))
+        else:
+            out.append(None)
+    return _column(finishes, out)
+
+
+# ── Stage 1: parse ────────────────────────────────────────────────────────────
+
+@dataclass
+class ParsedQuotation:
+    df: pd.DataFrame                  # Model / Shutter_Finish / Reference / Quantity per sheet row
+    project_id: str
+    service_charge_qty: float | None
+    glass_shutter_found: list         # glass-shutter models in sheet order
+    models: set                       # distinct normalized model codes
+    finishes: set                     # distinct normalized finish names
+
+
+def parse_quotation(contents: bytes) -> ParsedQuotation:
+    try:
+        sheet = load_quotation_sheet(contents)
+        df    = sheet.df
+    except Exception as e:
+        raise QuotationError(f"Unable to read Excel file: {e}")
+
+    # ── Column validation ─────────────────────────────────────────────────────
+    df.columns = df.columns.astype(str).str.strip()
+    required_cols = ["Reference", "Item", "Finishes"]
+    missing = [c for c in required_cols if c not in df.columns]
+    if missing:
+        raise QuotationError(f"Missing columns in sheet: {missing}")
+
+    # ── Quantity column (immediately right of "Finishes") ─────────────────────
+    try:
+        finishes_col_idx = df.columns.get_loc("Finishes")
+        quantity_col     = df.columns[finishes_col_idx + 1]
+    except (KeyError, IndexError):
+        raise QuotationError("Could not find the Quantity column (expected right after 'Finishes')")
+
+    df["Quantity"] = compute_quantities(df[quantity_col])
+
+    # ── Project ID ────────────────────────────────────────────────────────────
+    project_id_match = re.search(r"^\s*(\d+)", str(sheet.project_cell))
+    if not project_id_match:
+        raise QuotationError("Project ID not found in the file")
+    project_id = project_id_match.group(1)
+
+    # ── Derive model / finish / reference columns ─────────────────────────────
+    df["Model"]          = extract_models(df["Item"])
+    df["Shutter_Finish"] = extract_shutter_finishes(df["Finishes"])
+    df["Reference"]      = normalize_texts(df["Reference"])
+
+    # ── PRE-SCAN: collect all glass-shutter model rows present in this sheet ──
+    # Glass-shutter rows can appear ANYWHERE — before, between, or after the
+    # MK-prelam rows they describe. Scan once upfront; main loop skips them.
+    model_keys  = normalize_texts(df["Model"])
+    finish_keys = normalize_texts(df["Shutter_Finish"])
+    glass_shutter_found = [m for m in model_keys.drop_duplicates() if is_glass_shutter_model(m)]
+
+    print(f"Glass-shutter models found in sheet: {glass_shutter_found}")
+
+    # Distinct keys, so the handler can resolve every lookup up front
+    models   = set(model_keys.dropna())
+    finishes = set(finish_keys.dropna())
+
+    return ParsedQuotation(
+        df=df[["Model", "Shutter_Finish", "Reference", "Quantity"]],
+        project_id=project_id,
+        service_charge_qty=sheet.service_charge_qty,
+        glass_shutter_found=glass_shutter_found,
+        models=models,
+        finishes=finishes,
+    )
+
+
+# ── Output rows ───────────────────────────────────────────────────────────────
+# The row processors append to ResultBuffers with these columns; the
+# customer columns of the Success sheet are only filled in at render time.
+
+LINE_COLUMNS   = ["Order Lines/Product", "Order Lines/Description", "Cabinet Position",
+                  "Order Lines / Quantity"]
+FAILED_COLUMNS = ["Row", "Model", "Cabinet Position", "Reason"]
+CHANGE_COLUMNS = ["Change", *LINE_COLUMNS]
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+def get_colour_code(lookups, finish, model, index, reference, failed_rows):
+    match = lookups.fuzzy_finishes.get(finish)
+    if finish not in lookups.colours:
+        if match is not None:
+            failed_rows.append(index + 1, model, reference,
+                               f"Colour '{finish}' not found; closest match "
+                               f"'{match.colour_name}' ({match.colour_code}, "
+                               f"{match.score:.0%} similar) needs allow_fuzzy")
+        else:
+            failed_rows.append(index + 1, model, reference,
+                               f"Cabinet processed but could not find colour '{finish}'")
+        return None
+    if match is not None:
+        # Processed, but listed so the approximate colour match gets checked
+        failed_rows.append(index + 1, model, reference,
+                           f"Colour '{finish}' not found; used closest match "
+                           f"'{match.colour_name}' ({match.score:.0%} similar)")
+    return lookups.colours[finish]
+
+
+def get_odoo_code(lookups, model, index, reference, failed_rows):
+    if model not in lookups.odoo_codes:
+        failed_rows.append(index + 1, model, reference,
+                           f"No mapping found in code_raw for model '{model}'")
+        return None
+    return lookups.odoo_codes[model]
+
+
+# ── BOM expansion index ───────────────────────────────────────────────────────
+# The (product, description) lines of an MK cabinet depend only on its BOM
+# lines and the colour, and the same combinations recur across rows and
+# uploads. The key holds everything the lines are built from, so a changed
+# cabinet or colour simply misses and nothing has to be told about reloads.
+
+# (BOM lines, finish, colour code) combinations remembered per process
+BOM_INDEX_SIZE = 8192
+
+
+def _bom_expansion(key) -> tuple:
+    """(product, description) per non-empty BOM line, in one colour."""
+    bom_lines, finish, colour_code = key
+    lines = []
+    for bom in bom_lines:
+        if bom:
+            product = f"{bom}-{colour_code}"
+            # BOM line: [product_code] (finish_name)
+            lines.append((product, f"[{product}] ({finish})"))
+    return tuple(lines)
+
+
+BOM_INDEX = BoundedMemo(_bom_expansion, BOM_INDEX_SIZE)
+
+
+# ── Condition Processors ──────────────────────────────────────────────────────
+
+def process_mk_model(lookups, model, finish, quantity, index, reference,
+                     failed_rows, results):
+    bom_lines = lookups.cabinets.get(model)
+    if bom_lines is None:
+        failed_rows.append(index + 1, model, reference, "Cabinet not found in DB")
+        return False
+
+    # MK cabinet row: description is just the model code (no brackets).
+    # Prelam rows will have this overwritten in the post-loop patch.
+    results.append(model, model, reference, quantity)
+
+    # Prelam finishes are glass profiles — skip BOM colour lookup entirely.
+    # The description will be patched after the main loop.
+    if finish in PRELAM_FINISHES:
+        return True
+
+    colour_code = get_colour_code(lookups, finish, model, index, reference, failed_rows)
+    if not colour_code:
+        return True
+
+    for product, description in BOM_INDEX((bom_lines, finish, colour_code)):
+        results.append(product, description, reference, quantity)
+    return True
+
+
+def process_fil_model(lookups, model, finish, quantity, index, reference, failed_rows, results):
+    colour_code = get_colour_code(lookups, finish, model, index, reference, failed_rows)
+    if not colour_code:
+        return False
+
+    product = f"{model}-{colour_code}"
+    # FIL / EP line: [product_code] (finish_name)
+    results.append(product, f"[{product}] ({finish})", reference, quantity)
+    return True
+
+
+def process_generic_model(lookups, model, finish, quantity, index, reference, failed_rows, results):
+    odoo_code = get_odoo_code(lookups, model, index, reference, failed_rows)
+    if not odoo_code:
+        return False
+
+    # Generic row: [product_code] — no finish
+    results.append(odoo_code, f"[{odoo_code}]", reference, quantity)
+    return True
+
+
+# ── Routing ───────────────────────────────────────────────────────────────────
+# Which processor a model goes to is data (see routing.py); the table is
+# compiled once per process.
+
+HANDLERS = {
+    "mk":      process_mk_model,
+    "fil":     process_fil_model,
+    "generic": process_generic_model,
+}
+
+ROUTER = build_router()
+
+
+def process_row(lookups, model, finish, quantity, index, reference,
+                failed_rows, results, rule=None):
+    """Run the handler the routing table picks for `model`, then its extra lines."""
+    if rule is None:
+        rule = ROUTER.route(model)
+    success = HANDLERS[rule.handler](lookups, model, finish, quantity, index, reference,
+                                     failed_rows, results)
+    if success:                                            # only append if the row succeeded
+        for product in rule.extra_lines:
+            results.append(product, f"[{product}]", reference, quantity)
+    return success
+
+
+# ── Stage 2: expand rows and write the workbook ───────────────────────────────
+
+COLUMN_ORDER = [
+    "Customer",
+    "GST Treatment",
+    "POC",
+    "Cabinet Position",
+    "Tag",
+    "Project Name",
+    "Order Lines/Product",
+    "Order Lines/Description",
+    "Order Lines / Quantity",
+]
+
+
+@dataclass
+class RowSnapshot:
+    """
+    What each sheet row expanded to, keyed by (Reference, Model, Finish,
+    Quantity). Kept per project so the next revision of the sheet can reuse
+    the rows that did not change, and to diff the two uploads.
+    """
+    expansions: dict = field(default_factory=dict)  # key -> (success, lines, failures)
+    row_keys: list = field(default_factory=list)    # key per sheet row with a model, in order
+
+
+@dataclass
+class SalesOrder:
+    results: ResultBuffer             # LINE_COLUMNS, without customer details
+    failed_rows: ResultBuffer         # FAILED_COLUMNS
+    customer_row: int | None          # index in `results` that carries the customer details
+    rows: RowSnapshot = field(default_factory=RowSnapshot)
+    changes: list | None = None       # CHANGE_COLUMNS rows, when a diff was asked for
+
+
+def expand_quotation(quotation: ParsedQuotation, lookups: Lookups,
+                     previous: RowSnapshot | None = None) -> SalesOrder:
+    """
+    Expand every sheet row into order lines. Customer details are left out so
+    this can run before the CRM lookup has answered; `render_sales_order`
+    fills them in.
+
+    Rows found unchanged in `previous` (an earlier upload of the same project,
+    against the same catalogue) copy their lines from it instead of going
+    through the processors again.
+
+    Runs once over the sheet's columns as plain lists — no per-row Series.
+    """
+    df                  = quotation.df
+    glass_shutter_found = quotation.glass_shutter_found
+    service_charge_qty  = quotation.service_charge_qty
+
+    # Most rows yield one line; MK cabinets up to five, so the buffer grows
+    results     = ResultBuffer(LINE_COLUMNS, capacity=len(df) + 1)
+    failed_rows = ResultBuffer(FAILED_COLUMNS)
+
+    # ── Main loop ─────────────────────────────────────────────────────────────
+    customer_written = False
+    customer_row     = None
+    prelam_pending   = []  # [(result_idx, finish, mk_product, row, reference)]
+    snapshot         = RowSnapshot()
+    reusable         = previous.expansions if previous is not None else {}
+    expanded         = []  # [(key, success, first line, end, first failure, end)]
+
+    rows = zip(
+        df.index.tolist(),
+        _normalized(df["Model"]),
+        _normalized(df["Shutter_Finish"]),
+        _normalized(df["Reference"]),
+        df["Quantity"].tolist(),
+    )
+    route = ROUTER.route
+    for index, model, finish, reference, quantity in rows:
+        if not model:
+            continue
+
+        # Glass-shutter rows produce no output — handled via pre-scan + post-loop
+        if model in GLASS_SHUTTER_MODELS:
+            continue
+
+        key = (reference, model, finish, None if quantity != quantity else quantity)
+        snapshot.row_keys.append(key)
+
+        rule  = route(model)
+        is_mk = rule.handler == "mk"
+
+        # Standard finish-missing validation
+        if rule.requires_finish and not finish:
+            failed_rows.append(index + 1, model, reference, "Finish missing")
+            continue
+
+        before_idx = len(results)
+        expansion  = reusable.get(key)
+        if expansion is None:
+            before_failed = len(failed_rows)
+            success = process_row(lookups, model, finish, quantity, index, reference,
+                                  failed_rows, results, rule)
+            expanded.append((key, success, before_idx, len(results),
+                             before_failed, len(failed_rows)))
+        else:
+            success, lines, failures = expansion
+            for line in lines:
+                results.append(*line)
+            for failure in failures:
+                failed_rows.append(index + 1, *failure)
+            snapshot.expansions[key] = expansion
+        if not success:
+            continue
+
+        # Only the first successful row gets the customer details, and only an
+        # MK cabinet row has a slot for them.
+        if not customer_written:
+            customer_written = True
+            if is_mk:
+                customer_row = before_idx
+
+        # Track MK-prelam rows for post-loop description patch
+        if is_mk and finish in PRELAM_FINISHES:
+            prelam_pending.append((before_idx, finish, results.get(before_idx, "Order Lines/Product"), index + 1, reference))
+
+    # ── Row snapshot: lines as appended, before the prelam patch below ────────
+    if expanded:
+        lines    = list(results.rows())
+        failures = [failure[1:] for failure in failed_rows.rows()]  # without the row number
+        for key, success, start, end, failed_start, failed_end in expanded:
+            snapshot.expansions[key] = (success, tuple(lines[start:end]),
+                                        tuple(failures[failed_start:failed_end]))
+
+    # ── POST-LOOP: patch 3-line glass description onto every MK-prelam row ────
+    # All prelam rows in the sheet share the same single glass-shutter model.
+    if prelam_pending:
+        if not glass_shutter_found:
+            for _, _, mk_product, row, reference in prelam_pending:
+                failed_rows.append(
+                    row, mk_product, reference,
+                    "Prelam finish found but no glass-shutter profile model row exists in the sheet",
+                )
+        else:
+            glass_model = glass_shutter_found[0]  # one model shared by all prelam rows
+            for result_idx, finish, mk_product, _, _ in prelam_pending:
+                results.set(result_idx, "Order Lines/Description",
+                            build_glass_shutter_description(mk_product, glass_model, finish))
+
+    # ── Service charge row ────────────────────────────────────────────────────
+    if service_charge_qty is not None:
+        results.append("SR-0001", "[SR-0001]", "B2C Installation Service", service_charge_qty)
+    else:
+        print("Service charge quantity not found; skipping SR-0001 row.")
+
+    return SalesOrder(results=results, failed_rows=failed_rows, customer_row=customer_row,
+                      rows=snapshot)
+
+
+def _normalized(values: pd.Series) -> list:
+    """`normalize_text` over a column, as a list with None for missing values."""
+    return [None if v != v else v for v in normalize_texts(values).tolist()]
+
+
+def diff_rows(previous: RowSnapshot | None, current: RowSnapshot) -> list:
+    """
+    CHANGE_COLUMNS rows for the order lines that differ between two uploads,
+    compared sheet row by sheet row. A row whose Reference and Model are
+    still there but whose Finish or Quantity moved is "changed": its old lines
+    ("changed from") are followed by its new ones ("changed to").
+    """
+    old_keys = Counter(previous.row_keys if previous is not None else ())
+    new_keys = Counter(current.row_keys)
+    removed  = old_keys - new_keys
+    added    = new_keys - old_keys
+
+    def lines(snapshot, key):
+        expansion = snapshot.expansions.get(key)
+        return expansion[1] if expansion is not None else ()
+
+    # Removed rows in sheet order, indexed by (Reference, Model) to pair them
+    # with what replaced them; a paired row is set to None
+    gone     = []
+    replaced = {}
+    for key in previous.row_keys if previous is not None else ():
+        if removed[key] > 0:
+            removed[key] -= 1
+            replaced.setdefault(key[:2], []).append(len(gone))
+            gone.append(key)
+
+    changes = []
+    for key in current.row_keys:
+        if added[key] <= 0:
+            continue
+        added[key] -= 1
+        before = replaced.get(key[:2])
+        if before:
+            i = before.pop(0)
+            old, gone[i] = gone[i], None
+            changes.extend(("changed from", *line) for line in lines(previous, old))
+            changes.extend(("changed to", *line) for line in lines(current, key))
+        else:
+            changes.extend(("added", *line) for line in lines(current, key))
+    for key in gone:
+        if key is not None:
+            changes.extend(("removed", *line) for line in lines(previous, key))
+    return changes
+
+
+def sales_order_sheets(order: SalesOrder, project_name=None, customer=None, poc=None,
+                       include_empty=False) -> list:
+    """
+    The Success and Failed sheets as (title, columns, rows), customer details
+    added. Sheets without rows are left out unless `include_empty` is set;
+    Success is kept when both are empty, so a workbook always has a sheet.
+    """
+    results     = order.results
+    failed_rows = order.failed_rows
+    sheets      = []
+
+    if len(results) or include_empty or not len(failed_rows):
+        rows = results.rows(COLUMN_ORDER)
+        if order.customer_row is not None:
+            customer_meta = {
+                "Customer":      customer or "Default Customer",
+                "GST Treatment": "Consumer",
+                "POC":           poc or "Default POC",
+                "Tag":           "Product",
+                "Project Name":  project_name or "Default Project Name",
+            }
+            rows = list(rows)
+            rows[order.customer_row] = tuple(
+                customer_meta.get(name, value)
+                for name, value in zip(COLUMN_ORDER, rows[order.customer_row])
+            )
+        sheets.append(("Success", COLUMN_ORDER, rows))
+    if len(failed_rows) or include_empty:
+        sheets.append(("Failed", FAILED_COLUMNS, failed_rows.rows()))
+    if order.changes is not None:
+        sheets.append(("Changes", CHANGE_COLUMNS, order.changes))
+    return sheets
+
+
+def stream_sales_order(order: SalesOrder, project_name=None, customer=None, poc=None,
+                       fmt="xlsx", sheet=None):
+    """
+    The output as chunks, produced while rows are serialized: the workbook,
+    or for `fmt` csv/ndjson/json the same rows as text (see output_formats).
+    """
+    sheets = sales_order_sheets(order, project_name, customer, poc, include_empty=fmt != "xlsx")
+    return encode_sheets(sheets, fmt, sheet)
+
+
+def render_sales_order(order: SalesOrder, project_name=None, customer=None, poc=None,
+                       fmt="xlsx", sheet=None) -> bytes:
+    """Add the customer details to the order and return the whole output, xlsx by default."""
+    if fmt == "xlsx":
+        return write_xlsx(sales_order_sheets(order, project_name, customer, poc))
+    chunks = stream_sales_order(order, project_name, customer, poc, fmt, sheet)
+    return "".join(chunks).encode("utf-8")
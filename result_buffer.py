@@ -0,0 +1,72 @@
+"""
+Column-oriented row storage for the output sheets.
+
+One list per column, allocated up front and grown in steps, instead of one
+dict per row carrying the same string keys. Repeated strings (the same BOM
+product and description across many cabinets) are interned per buffer, so
+each distinct value is held — and pickled back from a worker — only once.
+"""
+
+
+class ResultBuffer:
+    __slots__ = ("columns", "_index", "_data", "_size", "_strings")
+
+    def __init__(self, columns, capacity: int = 64):
+        self.columns  = list(columns)
+        self._index   = {name: i for i, name in enumerate(self.columns)}
+        self._data    = [[None] * capacity for _ in self.columns]
+        self._size    = 0
+        self._strings = {}
+
+    def __len__(self):
+        return self._size
+
+    def _intern(self, value):
+        if type(value) is str:
+            return self._strings.setdefault(value, value)
+        return value
+
+    def append(self, *values):
+        """Add one row; values in `columns` order."""
+        row = self._size
+        if row == len(self._data[0]):
+            grow = [None] * max(row, 64)
+            for column in self._data:
+                column.extend(grow)
+        intern = self._intern
+        for column, value in zip(self._data, values):
+            column[row] = intern(value)
+        self._size = row + 1
+
+    def get(self, row: int, column: str):
+        return self._data[self._index[column]][row]
+
+    def set(self, row: int, column: str, value):
+        if not 0 <= row < self._size:
+            raise IndexError(row)
+        self._data[self._index[column]][row] = self._intern(value)
+
+    def rows(self, columns=None):
+        """
+        Row tuples in `columns` order (default: the buffer's own). Names the
+        buffer does not have come out as None.
+        """
+        size    = self._size
+        missing = [None] * size
+        picked  = [
+            self._data[self._index[name]][:size] if name in self._index else missing
+            for name in (columns or self.columns)
+        ]
+        return zip(*picked)
+
+    def __getstate__(self):
+        # Ship only the filled part of each column
+        return (self.columns, [column[:self._size] for column in self._data])
+
+    def __setstate__(self, state):
+        columns, data = state
+        self.columns  = columns
+        self._index   = {name: i for i, name in enumerate(columns)}
+        self._data    = data
+        self._size    = len(data[0]) if data else 0
+        self._strings = {}
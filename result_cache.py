@@ -0,0 +1,118 @@
+"""
+On-disk cache of finished outputs, so the same workbook uploaded again
+(a browser retry, a colleague re-sending it) is answered without parsing,
+lookups or Odoo.
+
+Entries are keyed by the SHA-256 of the uploaded bytes, the catalogue
+version stamp, the routing rules and the requested format. A change to
+`cabinets`, `cabinet_bom`, `colorcode` or `code_raw` moves the stamp, so older
+entries are simply never hit again and age out. The directory is capped at
+RESULT_CACHE_MAX_BYTES; a hit refreshes the entry's mtime and the least
+recently used files are deleted first. Set RESULT_CACHE_MAX_BYTES=0 to
+turn the cache off.
+
+The CRM details in a cached output are the ones from when it was first
+produced.
+"""
+import hashlib
+import os
+import tempfile
+
+from routing import ROUTING_RULES_PATH
+
+RESULT_CACHE_DIR       = os.getenv("RESULT_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "so_generation_results")
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+_SUFFIX = ".out"
+
+
+def _rules_digest() -> str:
+    if not ROUTING_RULES_PATH:
+        return "default"
+    with open(ROUTING_RULES_PATH, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory: str = RESULT_CACHE_DIR, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._rules    = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key(self, contents: bytes, version, *params) -> str | None:
+        """Cache key for one upload, or None when it must not be cached (unknown version)."""
+        if not self.enabled or version is None:
+            return None
+        if self._rules is None:
+            self._rules = _rules_digest()
+        digest = hashlib.sha256(contents)
+        for part in (repr(version), self._rules, *map(str, params)):
+            digest.update(b"\0" + part.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def get(self, key: str | None) -> bytes | None:
+        if key is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mark as recently used
+        except OSError:
+            return None
+        return data
+
+    def put(self, key: str | None, data: bytes):
+        if key is None or len(data) > self.max_bytes:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Written aside and renamed, so readers never see half a file
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+            self._evict()
+        except OSError as e:
+            print(f"Could not store result in cache: {e}")
+
+    def store_stream(self, key: str | None, chunks):
+        """Pass `chunks` through and store the whole output once the last one is sent."""
+        if key is None:
+            yield from chunks
+            return
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+            yield chunk
+        self.put(key, b"".join(parts))
+
+    def _evict(self):
+        entries = []
+        total   = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(_SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+result_cache = ResultCache()
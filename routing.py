@@ -0,0 +1,112 @@
+"""
+Product routing: which row processor handles a model code, whether the row
+needs a shutter finish, and which fixed lines follow a successful row.
+
+Rules are matched exact code first, then longest prefix; anything else goes
+to the generic code_raw handler. The built-in table reproduces the original
+routing. Set ROUTING_RULES_PATH to a CSV file to replace it:
+
+    match,pattern,handler,requires_finish,extra_lines
+    prefix,MK-,mk,yes,
+    exact,P1725-AA,fil,no,M-CF-217
+
+`extra_lines` holds product codes separated by ";".
+"""
+import csv
+import os
+from dataclasses import dataclass
+
+from memo import BoundedMemo
+
+ROUTING_RULES_PATH = os.getenv("ROUTING_RULES_PATH")
+
+# Distinct model codes remembered per router before the memo starts over
+ROUTE_MEMO_SIZE = 4096
+
+HANDLER_NAMES = ("mk", "fil", "generic")
+
+
+@dataclass(frozen=True)
+class RoutingRule:
+    match: str                   # "exact" or "prefix"
+    pattern: str
+    handler: str                 # one of HANDLER_NAMES
+    requires_finish: bool = False
+    extra_lines: tuple = ()      # product codes appended after a successful row
+
+
+GENERIC_RULE = RoutingRule("prefix", "", "generic")
+
+DEFAULT_RULES = [
+    RoutingRule("prefix", "MK-",  "mk",  requires_finish=True),
+    RoutingRule("prefix", "FIL-", "fil", requires_finish=True),
+    RoutingRule("prefix", "EP-",  "fil", requires_finish=True),
+    *(RoutingRule("exact", code, "fil", extra_lines=("M-CF-217",))
+      for code in ("P1725-AA", "P1724-AA", "P1723-AA", "P1722-AA")),
+]
+
+
+def load_rules(path: str) -> list:
+    """Read rules from a CSV file in the format shown in the module docstring."""
+    rules = []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                match   = row["match"].strip().lower()
+                pattern = row["pattern"].strip()
+                handler = row["handler"].strip().lower()
+            except (KeyError, AttributeError):
+                raise ValueError(f"{path}:{line_no}: expected match, pattern and handler columns")
+            extra = (row.get("extra_lines") or "").split(";")
+            rules.append(RoutingRule(
+                match=match,
+                pattern=pattern,
+                handler=handler,
+                requires_finish=(row.get("requires_finish") or "").strip().lower() in ("1", "true", "yes", "y"),
+                extra_lines=tuple(code.strip() for code in extra if code.strip()),
+            ))
+    return rules
+
+
+class Router:
+    """
+    Rules compiled into one dict for exact codes and one for prefixes, probed
+    from the longest prefix length down. Results are memoised per model code,
+    so a sheet's repeated models cost a single dict lookup each.
+    """
+
+    def __init__(self, rules):
+        self._exact  = {}
+        self._prefix = {}
+        for rule in rules:
+            if rule.handler not in HANDLER_NAMES:
+                raise ValueError(f"Unknown routing handler {rule.handler!r} for {rule.pattern!r}")
+            if rule.match == "exact":
+                self._exact.setdefault(rule.pattern, rule)
+            elif rule.match == "prefix" and rule.pattern:
+                self._prefix.setdefault(rule.pattern, rule)
+            else:
+                raise ValueError(f"Invalid routing rule: {rule}")
+        self._lengths = sorted({len(p) for p in self._prefix}, reverse=True)
+        self._memo    = BoundedMemo(self._resolve, ROUTE_MEMO_SIZE)
+
+    def route(self, model: str) -> RoutingRule:
+        return self._memo(model)
+
+    def _resolve(self, model: str) -> RoutingRule:
+        rule = self._exact.get(model)
+        if rule is None:
+            for n in self._lengths:
+                rule = self._prefix.get(model[:n])
+                if rule is not None:
+                    break
+            else:
+                rule = GENERIC_RULE
+        return rule
+
+
+def build_router() -> Router:
+    if ROUTING_RULES_PATH:
+        print(f"Loading routing rules from {ROUTING_RULES_PATH}")
+        return Router(load_rules(ROUTING_RULES_PATH))
+    return Router(DEFAULT_RULES)
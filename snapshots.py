@@ -0,0 +1,73 @@
+"""
+Last expansion of each CRM project, so a revised upload of the same project
+re-expands only the rows that changed and can be diffed against the one
+before. Held in memory per server process, least recently used projects
+dropped past PROJECT_SNAPSHOT_SIZE.
+
+An upload answered from the result cache is not expanded, so its snapshot
+is stored next to the cached output (`dump_snapshot`) and put back on a hit
+(`load_snapshot`), as expanding it again would have done.
+"""
+import json
+import os
+from collections import OrderedDict
+
+from pipeline import RowSnapshot
+
+PROJECT_SNAPSHOT_SIZE = int(os.getenv("PROJECT_SNAPSHOT_SIZE", "64"))
+
+
+class ProjectSnapshots:
+    def __init__(self, size: int = PROJECT_SNAPSHOT_SIZE):
+        self.size     = size
+        self._entries = OrderedDict()  # project_id -> (stamp, RowSnapshot)
+
+    def get(self, project_id: str):
+        """
+        (stamp, RowSnapshot) of the project's last upload, or (None, None). The
+        stamp is whatever the caller expanded it under: catalogue version and
+        fuzzy-match setting.
+        """
+        entry = self._entries.get(project_id)
+        if entry is None:
+            return None, None
+        self._entries.move_to_end(project_id)
+        return entry
+
+    def put(self, project_id: str, stamp, snapshot):
+        if self.size <= 0:
+            return
+        self._entries[project_id] = (stamp, snapshot)
+        self._entries.move_to_end(project_id)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def dump_snapshot(project_id: str, snapshot: RowSnapshot) -> bytes | None:
+    """The snapshot as JSON, or None if a value does not serialize."""
+    try:
+        return json.dumps({
+            "project_id": project_id,
+            "row_keys":   snapshot.row_keys,
+            "expansions": [[key, *expansion] for key, expansion in snapshot.expansions.items()],
+        }).encode("utf-8")
+    except (TypeError, ValueError) as e:
+        print(f"Could not serialize snapshot of project {project_id}: {e}")
+        return None
+
+
+def load_snapshot(data: bytes):
+    """(project_id, RowSnapshot) from `dump_snapshot` output; JSON lists become tuples again."""
+    state = json.loads(data)
+    expansions = {
+        tuple(key): (success, tuple(map(tuple, lines)), tuple(map(tuple, failures)))
+        for key, success, lines, failures in state["expansions"]
+    }
+    row_keys = [tuple(key) for key in state["row_keys"]]
+    return state["project_id"], RowSnapshot(expansions, row_keys)
+
+
+project_snapshots = ProjectSnapshots()
@@ -0,0 +1,16 @@
+"""
+The modules under test import database.py, which builds its engines from the
+DB_* variables at import time. Engines only connect when first used, so
+placeholder values let everything import without a database; tests that need
+Postgres read TEST_DATABASE_URL instead.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+for name, value in {"DB_USER": "test", "DB_PASSWORD": "test", "DB_HOST": "localhost",
+                    "DB_PORT": "5432", "DB_NAME": "test"}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,124 @@
+"""
+catalogue_loader against a real Postgres: COPY into the staging tables, the
+swap, the version bump and the id sequences. Skipped unless TEST_DATABASE_URL
+points at a database, e.g. postgresql://postgres@localhost/postgres; every
+test builds the pre-migration schema in a schema of its own and drops it.
+"""
+import io
+import os
+import uuid
+
+import openpyxl
+import pytest
+from sqlalchemy import create_engine, text
+
+import migrations
+from catalogue_loader import CatalogueError, current_version, load_catalogue
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+# The tables as they were before migrations.py
+LEGACY_SCHEMA = [
+    "CREATE TABLE cabinets (id serial PRIMARY KEY, cabinet_code varchar, bom_line_1 varchar, "
+    "bom_line_2 varchar, bom_line_3 varchar, bom_line_4 varchar)",
+    "CREATE TABLE colorcode (id serial PRIMARY KEY, colour_name varchar, colour_code varchar)",
+    "CREATE TABLE code_raw (infurnia_code varchar(50) PRIMARY KEY, odoo_code varchar(50))",
+    "INSERT INTO cabinets (cabinet_code, bom_line_1, bom_line_2) VALUES ('OLD-1', 'OLD-A', 'OLD-B')",
+    "INSERT INTO colorcode (colour_name, colour_code) VALUES ('Old Colour', 'OC')",
+    "INSERT INTO code_raw (infurnia_code, odoo_code) VALUES ('OLD-1', 'ODOO-OLD')",
+]
+
+
+@pytest.fixture
+def bind():
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    admin  = create_engine(TEST_DATABASE_URL)
+    with admin.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_engine(TEST_DATABASE_URL, connect_args={"options": f"-csearch_path={schema}"})
+    try:
+        with engine.begin() as conn:
+            for statement in LEGACY_SCHEMA:
+                conn.execute(text(statement))
+        migrations.migrate(bind=engine)
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin.dispose()
+
+
+def rows(bind, query):
+    with bind.connect() as conn:
+        return [tuple(row) for row in conn.execute(text(query))]
+
+
+def test_migrations_move_bom_lines_and_start_version(bind):
+    assert rows(bind, "SELECT c.cabinet_code, b.ordinal, b.product_code FROM cabinet_bom b "
+                      "JOIN cabinets c ON c.id = b.cabinet_id ORDER BY b.ordinal") == [
+        ("OLD-1", 1, "OLD-A"), ("OLD-1", 2, "OLD-B"),
+    ]
+    assert current_version(bind).version == 1
+
+
+def test_load_colorcode_replaces_table_and_bumps_version(bind):
+    contents = b"Colour_Name,Colour_Code\nGlacier Veil Gloss,GVG\n Mistfield Gloss ,MG\nNo Code,\n"
+    result   = load_catalogue("colorcode", "colours.csv", contents, bind=bind)
+
+    assert (result["rows"], result["version"]) == (3, 2)
+    assert rows(bind, "SELECT id, colour_name, colour_code FROM colorcode ORDER BY id") == [
+        (1, "Glacier Veil Gloss", "GVG"), (2, "Mistfield Gloss", "MG"), (3, "No Code", None),
+    ]
+    # The id sequence continues after the loaded rows
+    assert rows(bind, "INSERT INTO colorcode (colour_name, colour_code) "
+                      "VALUES ('Added', 'AD') RETURNING id") == [(4,)]
+
+    load_catalogue("colorcode", "colours.csv", contents, bind=bind)
+    assert current_version(bind).version == 3
+
+
+def test_load_cabinets_from_bom_columns(bind):
+    contents = b"cabinet_code,bom_line_1,bom_line_3,bom_line_12\nEP-22,EP-A,EP-C,\nSH-2,,SH-C,SH-L\n"
+    result   = load_catalogue("cabinets", "cabinets.csv", contents, bind=bind)
+
+    assert (result["rows"], result["bom_lines"]) == (2, 4)
+    assert rows(bind, "SELECT c.cabinet_code, b.ordinal, b.product_code FROM cabinet_bom b "
+                      "JOIN cabinets c ON c.id = b.cabinet_id ORDER BY c.id, b.ordinal") == [
+        ("EP-22", 1, "EP-A"), ("EP-22", 3, "EP-C"), ("SH-2", 3, "SH-C"), ("SH-2", 12, "SH-L"),
+    ]
+    assert rows(bind, "INSERT INTO cabinets (cabinet_code) VALUES ('NEW') RETURNING id") == [(3,)]
+
+
+def test_load_code_raw_from_xlsx(bind):
+    workbook = openpyxl.Workbook()
+    sheet    = workbook.active
+    sheet.append(["infurnia_code", "odoo_code"])
+    sheet.append(["EP-22", 4711])     # numeric codes come back as text
+    sheet.append(["SH-2", "SH-2-ODOO"])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+
+    load_catalogue("code_raw", "codes.xlsx", buffer.getvalue(), bind=bind)
+    assert rows(bind, "SELECT infurnia_code, odoo_code FROM code_raw ORDER BY infurnia_code") == [
+        ("EP-22", "4711"), ("SH-2", "SH-2-ODOO"),
+    ]
+
+
+def test_failed_load_keeps_previous_catalogue(bind):
+    # Longer than code_raw's varchar(50): fails inside Postgres, after the COPY
+    contents = b"infurnia_code,odoo_code\nEP-22,ODOO-1\nSH-2," + b"X" * 60 + b"\n"
+    with pytest.raises(CatalogueError, match="Loading code_raw failed"):
+        load_catalogue("code_raw", "codes.csv", contents, bind=bind)
+
+    assert rows(bind, "SELECT infurnia_code, odoo_code FROM code_raw") == [("OLD-1", "ODOO-OLD")]
+    assert current_version(bind).version == 1
+
+
+def test_rejects_duplicate_keys_before_touching_the_database(bind):
+    contents = b"colour_name,colour_code\nA,1\nA,2\n"
+    with pytest.raises(CatalogueError, match="duplicate colour_name 'A'"):
+        load_catalogue("colorcode", "colours.csv", contents, bind=bind)
+    assert current_version(bind).version == 1
@@ -0,0 +1,72 @@
+"""diff_rows between two uploads of one project, built from hand-made snapshots."""
+from pipeline import RowSnapshot, diff_rows
+
+
+def line(reference, model, finish, quantity):
+    code = f"{model}-{finish[:3].upper()}"
+    return (code, f"[{code}] ({finish})", reference, quantity)
+
+
+def snapshot(*rows, failed=()) -> RowSnapshot:
+    """A snapshot of sheet rows (Reference, Model, Finish, Quantity); `failed` rows expand to nothing."""
+    result = RowSnapshot()
+    for key in rows:
+        result.row_keys.append(key)
+        lines = () if key in failed else (line(*key),)
+        result.expansions[key] = (not lines, lines, ())
+    return result
+
+
+A = ("B1", "EP-22", "Glacier Veil Gloss", 1)
+B = ("B2", "SH-2", "Courtyard Clay Gloss", 2)
+C = ("B3", "P1725-AA", "Mistfield Gloss", 1)
+
+
+def test_first_upload_adds_everything():
+    assert diff_rows(None, snapshot(A, B)) == [("added", *line(*A)), ("added", *line(*B))]
+
+
+def test_same_rows_in_another_order_are_unchanged():
+    assert diff_rows(snapshot(A, B, C), snapshot(C, A, B)) == []
+
+
+def test_quantity_change_pairs_old_and_new_lines():
+    more = A[:3] + (4,)
+    assert diff_rows(snapshot(A, B), snapshot(more, B)) == [
+        ("changed from", *line(*A)), ("changed to", *line(*more)),
+    ]
+
+
+def test_finish_change_is_a_change_not_add_and_remove():
+    other = A[:2] + ("Mistfield Gloss", 1)
+    assert diff_rows(snapshot(A), snapshot(other)) == [
+        ("changed from", *line(*A)), ("changed to", *line(*other)),
+    ]
+
+
+def test_new_reference_is_added_and_missing_one_removed():
+    moved = ("B9",) + A[1:]
+    assert diff_rows(snapshot(A, B), snapshot(B, moved, C)) == [
+        ("added", *line(*moved)), ("added", *line(*C)), ("removed", *line(*A)),
+    ]
+
+
+def test_duplicate_rows_are_counted():
+    assert diff_rows(snapshot(A, A, B), snapshot(A, B)) == [("removed", *line(*A))]
+    assert diff_rows(snapshot(A, B), snapshot(A, B, A)) == [("added", *line(*A))]
+
+
+def test_repeated_reference_and_model_pair_in_sheet_order():
+    first, second = ("B1", "EP-22", "Glacier Veil Gloss", 1), ("B1", "EP-22", "Glacier Veil Gloss", 2)
+    new_first, new_second = first[:3] + (5,), second[:3] + (6,)
+    assert diff_rows(snapshot(first, second), snapshot(new_first, new_second)) == [
+        ("changed from", *line(*first)), ("changed to", *line(*new_first)),
+        ("changed from", *line(*second)), ("changed to", *line(*new_second)),
+    ]
+
+
+def test_rows_without_lines_contribute_nothing():
+    broken = ("B4", "HW-404", "Mistfield Gloss", 1)
+    assert diff_rows(snapshot(A), snapshot(A, broken, failed={broken})) == []
+    # Rows are compared by their sheet values, not by what they expanded to
+    assert diff_rows(snapshot(A, broken, failed={broken}), snapshot(A, broken)) == []
@@ -0,0 +1,92 @@
+"""FinishIndex matching, and how Lookups.subset and get_colour_code use fuzzy matches."""
+import pytest
+
+from finish_index import FinishIndex
+from lookup_cache import Lookups
+from pipeline import FAILED_COLUMNS, get_colour_code
+from result_buffer import ResultBuffer
+
+COLOURS = {
+    "Glacier Veil Gloss":   "GVG",
+    "Glacier Veil Matt":    "GVM",
+    "Mistfield Gloss":      "MG",
+    "Courtyard Clay Gloss": "CCG",
+}
+
+
+@pytest.fixture
+def index():
+    return FinishIndex(COLOURS, threshold=0.8)
+
+
+def test_exact_and_normalized_names(index):
+    match = index.match("Mistfield Gloss")
+    assert (match.kind, match.colour_code) == ("exact", "MG")
+    match = index.match("  mistfield   GLOSS ")
+    assert (match.kind, match.colour_name, match.colour_code, match.exact) == (
+        "normalized", "Mistfield Gloss", "MG", True)
+
+
+def test_typo_above_threshold_is_fuzzy(index):
+    match = index.match("Glacier Vail Gloss")
+    assert (match.kind, match.colour_name, match.colour_code, match.exact) == (
+        "fuzzy", "Glacier Veil Gloss", "GVG", False)
+    assert match.score == pytest.approx(0.833, abs=1e-3)
+
+
+@pytest.mark.parametrize("threshold, expected", [(0.83, "Glacier Veil Gloss"), (0.84, None)])
+def test_threshold_is_inclusive_lower_bound(threshold, expected):
+    match = FinishIndex(COLOURS, threshold=threshold).match("Glacier Vail Gloss")   # scores 0.833
+    assert (match.colour_name if match else None) == expected
+
+
+def test_threshold_one_disables_fuzzy_matching():
+    index = FinishIndex(COLOURS, threshold=1)
+    assert index.match("Glacier Vail Gloss") is None
+    assert index.match("glacier veil gloss").kind == "normalized"
+
+
+def test_ambiguous_candidates_within_margin_do_not_match():
+    # "Glacier Veil" scores the same against the Gloss and the Matt colour
+    assert FinishIndex(COLOURS, threshold=0.5).match("Glacier Veil") is None
+    # One clearly closer candidate is fine at the same threshold
+    assert FinishIndex(COLOURS, threshold=0.5).match("Glacier Veil Gl Matt").colour_code == "GVM"
+
+
+@pytest.mark.parametrize("finish", ["", "   ", "Walnut", "Mist"])
+def test_unrelated_or_empty_names_do_not_match(index, finish):
+    assert index.match(finish) is None
+
+
+def test_repeated_lookups_are_memoized(index):
+    first = index.match("Mistfeld Gloss")
+    assert index.match("mistfeld  gloss") is first
+
+
+def test_subset_keeps_fuzzy_colours_out_unless_allowed():
+    lookups = Lookups(colours=dict(COLOURS))
+    finishes = ["Mistfield Gloss", "Glacier Vail Gloss", "Walnut"]
+
+    strict = lookups.subset((), finishes)
+    assert strict.colours == {"Mistfield Gloss": "MG"}
+    assert strict.fuzzy_finishes["Glacier Vail Gloss"].colour_code == "GVG"
+
+    allowed = lookups.subset((), finishes, allow_fuzzy=True)
+    assert allowed.colours == {"Mistfield Gloss": "MG", "Glacier Vail Gloss": "GVG"}
+    # A subset of a subset decides again, from the recorded match
+    assert strict.subset((), finishes, allow_fuzzy=True).colours == allowed.colours
+    assert allowed.subset((), finishes).colours == strict.colours
+
+
+@pytest.mark.parametrize("allow_fuzzy, code, reason", [
+    (False, None, "Colour 'Glacier Vail Gloss' not found; closest match 'Glacier Veil Gloss' "
+                  "(GVG, 83% similar) needs allow_fuzzy"),
+    (True, "GVG", "Colour 'Glacier Vail Gloss' not found; used closest match "
+                  "'Glacier Veil Gloss' (83% similar)"),
+])
+def test_get_colour_code_reports_fuzzy_matches(allow_fuzzy, code, reason):
+    lookups = Lookups(colours=dict(COLOURS)).subset((), ["Glacier Vail Gloss"], allow_fuzzy)
+    failed  = ResultBuffer(FAILED_COLUMNS)
+
+    assert get_colour_code(lookups, "Glacier Vail Gloss", "EP-22", 4, "B1", failed) == code
+    assert list(failed.rows()) == [(5, "EP-22", "B1", reason)]
@@ -0,0 +1,156 @@
+"""
+/push-to-odoo against a local stand-in for Odoo's XML-RPC endpoints: the
+token check, the calls that create the order, the 422 for products Odoo does
+not have, and a second push of the same file. Parsing and expansion are
+replaced by a fixed order so no catalogue database is needed.
+"""
+import threading
+from types import SimpleNamespace
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import odoo
+from database import get_async_db
+from pipeline import FAILED_COLUMNS, LINE_COLUMNS, SalesOrder
+from result_buffer import ResultBuffer
+
+TOKEN   = "push-token"
+CRM_ID  = "4711"
+UPLOAD  = ("quotation.xlsx", b"not parsed: parse_workbook is replaced")
+HEADERS = {"X-Push-Token": TOKEN}
+
+
+class FakeOdoo:
+    """Answers authenticate and execute_kw the way Odoo does, recording each call."""
+
+    def __init__(self):
+        self.calls    = []
+        self.products = {"EP-22-GVG": 101, "SH-2-CCG": 102}
+        self.orders   = []  # created sale.order values; ids start at 500
+
+    def authenticate(self, db, username, password, context):
+        return 7
+
+    def execute_kw(self, db, uid, password, model, method, args, kwargs=None):
+        self.calls.append((model, method))
+        if (model, method) == ("product.product", "search_read"):
+            codes = args[0][0][2]
+            return [{"id": self.products[c], "default_code": c} for c in codes if c in self.products]
+        if (model, method) == ("crm.lead", "search_read"):
+            return [{"id": int(CRM_ID), "partner_id": [3, "Acme"]}]
+        if (model, method) == ("sale.order", "search_read"):
+            domain = dict((field, value) for field, _, value in args[0])
+            return [{"id": 500 + n} for n, values in enumerate(self.orders)
+                    if values["origin"] == domain["origin"]][:1]
+        if (model, method) == ("sale.order", "create"):
+            self.orders.append(args[0])
+            return 500 + len(self.orders) - 1
+        raise AssertionError(f"unexpected call {model}.{method}")
+
+
+class _Handler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ("/xmlrpc/2/common", "/xmlrpc/2/object")
+
+
+@pytest.fixture
+def fake_odoo(monkeypatch):
+    fake   = FakeOdoo()
+    server = SimpleXMLRPCServer(("127.0.0.1", 0), requestHandler=_Handler,
+                                logRequests=False, allow_none=True)
+    server.register_function(fake.authenticate, "authenticate")
+    server.register_function(fake.execute_kw, "execute_kw")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(odoo, "client",
+                        odoo.OdooClient(f"http://127.0.0.1:{server.server_address[1]}", "db", "user", "pw"))
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(monkeypatch, fake_odoo):
+    lines = ResultBuffer(LINE_COLUMNS)
+    lines.append("EP-22-GVG", "[EP-22-GVG] (Glacier Veil Gloss)", "5", 2)
+    lines.append("SH-2-CCG", "[SH-2-CCG] (Courtyard Clay Gloss)", "B1", 1)
+    failed = ResultBuffer(FAILED_COLUMNS)
+    failed.append(7, "HW-404", "B2", "No mapping found in code_raw for model 'HW-404'")
+
+    async def parse_workbook(contents):
+        return SimpleNamespace(project_id=CRM_ID)
+
+    async def catalogue_version_async(db):
+        return None
+
+    async def expand_upload(quotation, db, version, diff=False, allow_fuzzy=False):
+        return SalesOrder(results=lines, failed_rows=failed, customer_row=0)
+
+    async def no_db():
+        yield None
+
+    monkeypatch.setattr(main, "PUSH_API_TOKEN", TOKEN)
+    monkeypatch.setattr(main, "parse_workbook", parse_workbook)
+    monkeypatch.setattr(main, "catalogue_version_async", catalogue_version_async)
+    monkeypatch.setattr(main, "expand_upload", expand_upload)
+    monkeypatch.setitem(main.app.dependency_overrides, get_async_db, no_db)
+    with TestClient(main.app) as client:
+        yield client
+
+
+def push(client, headers=HEADERS):
+    return client.post("/push-to-odoo", files={"file": UPLOAD}, headers=headers)
+
+
+# Non-ASCII headers arrive as latin-1 str, which compare_digest would refuse
+@pytest.mark.parametrize("headers", [{}, {"X-Push-Token": "wrong"}, {"X-Push-Token": "wrông".encode()}])
+def test_rejects_missing_or_wrong_token(client, fake_odoo, headers):
+    assert push(client, headers).status_code == 401
+    assert fake_odoo.calls == []
+
+
+def test_disabled_without_a_configured_token(client, fake_odoo, monkeypatch):
+    monkeypatch.setattr(main, "PUSH_API_TOKEN", None)
+    assert push(client).status_code == 403
+    assert fake_odoo.calls == []
+
+
+def test_creates_order_with_all_lines(client, fake_odoo):
+    response = push(client)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["sale_order_id"], body["created"], body["lines"]) == (500, True, 2)
+    assert [row["Model"] for row in body["failed_rows"]] == ["HW-404"]
+    # Three lookups at once, then the create
+    assert sorted(fake_odoo.calls[:3]) == [
+        ("crm.lead", "search_read"), ("product.product", "search_read"), ("sale.order", "search_read"),
+    ]
+    assert fake_odoo.calls[3:] == [("sale.order", "create")]
+
+    (values,) = fake_odoo.orders
+    assert (values["partner_id"], values["opportunity_id"]) == (3, int(CRM_ID))
+    assert values["origin"].startswith("Infurnia upload ")
+    assert [line[2]["product_id"] for line in values["order_line"]] == [101, 102]
+    assert [line[2]["product_uom_qty"] for line in values["order_line"]] == [2, 1]
+
+
+def test_second_push_of_same_file_returns_existing_order(client, fake_odoo):
+    first  = push(client).json()
+    second = push(client).json()
+
+    assert (second["sale_order_id"], second["created"]) == (first["sale_order_id"], False)
+    assert len(fake_odoo.orders) == 1
+    assert fake_odoo.calls.count(("sale.order", "create")) == 1
+
+
+def test_missing_products_give_422_and_create_nothing(client, fake_odoo):
+    del fake_odoo.products["SH-2-CCG"]
+    response = push(client)
+
+    assert response.status_code == 422
+    assert response.json()["detail"]["missing_products"] == ["SH-2-CCG"]
+    assert ("sale.order", "create") not in fake_odoo.calls
+    assert fake_odoo.orders == []
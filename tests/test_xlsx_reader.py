@@ -0,0 +1,116 @@
+"""
+The streaming reader must return what the pandas fallback returns for the
+same workbook: the frame (values and dtypes), C2 and the Service Charges
+quantity. Workbooks are generated with openpyxl from a fixed seed, with the
+cell types Infurnia exports carry plus dates, times and pandas' NA strings.
+"""
+import io
+import random
+from datetime import date, datetime, time, timedelta
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from xlsx_reader import read_quotation_sheet, read_quotation_sheet_pandas
+
+HEADER = ["Sr No", "Reference", "Item", "Image", "Finishes", "Quantity", "Rate", None, "Item"]
+
+_DATE_FORMATS = ["yyyy-mm-dd", "dd/mm/yyyy hh:mm", "mm-dd-yy", "h:mm:ss", "[h]:mm:ss"]
+
+
+def _random_value(rng: random.Random):
+    kind = rng.choice(["empty", "text", "int", "float", "bool", "na", "date", "datetime",
+                       "time", "numeric-text"])
+    if kind == "empty":
+        return None, None
+    if kind == "text":
+        return rng.choice(["KSP-01 MG", "EP-22", "Glacier Veil Gloss", " padded ", "B1"]), None
+    if kind == "int":
+        return rng.randint(-5, 500), None
+    if kind == "float":
+        return round(rng.uniform(0, 100), rng.choice([1, 2, 6])), None
+    if kind == "bool":
+        return rng.choice([True, False]), None
+    if kind == "na":
+        return rng.choice(["NA", "n/a", "NULL", "nan", "#N/A"]), None
+    if kind == "date":
+        return date(2020, 1, 1) + timedelta(days=rng.randint(0, 2000)), "yyyy-mm-dd"
+    if kind == "datetime":
+        stamp = datetime(2024, 5, 17, 9, 30) + timedelta(minutes=rng.randint(0, 10 ** 6))
+        return stamp, rng.choice(_DATE_FORMATS[:3])
+    if kind == "time":
+        return time(rng.randint(0, 23), rng.randint(0, 59)), "h:mm:ss"
+    return str(rng.randint(1, 99)), None
+
+
+def make_workbook(seed: int, date1904: bool = False) -> bytes:
+    rng      = random.Random(seed)
+    workbook = openpyxl.Workbook()
+    workbook.epoch = openpyxl.utils.datetime.CALENDAR_MAC_1904 if date1904 else workbook.epoch
+    sheet    = workbook.active
+    sheet["A1"] = "Quotation"
+    sheet["C2"] = "12345 - Kitchen"
+    for col, name in enumerate(HEADER, start=1):
+        sheet.cell(row=3, column=col, value=name)
+
+    n_rows = rng.randint(5, 40)
+    for row in range(4, 4 + n_rows):
+        for col in range(1, len(HEADER) + 1):
+            value, number_format = _random_value(rng)
+            if value is None:
+                continue
+            cell = sheet.cell(row=row, column=col, value=value)
+            if number_format:
+                cell.number_format = number_format
+        # A duration, kept as a timedelta by openpyxl
+        if rng.random() < 0.2:
+            cell = sheet.cell(row=row, column=6, value=timedelta(hours=rng.randint(1, 60)))
+            cell.number_format = "[h]:mm:ss"
+
+    if rng.random() < 0.7:
+        start = 4 + n_rows + rng.randint(0, 2)
+        sheet.cell(row=start, column=2, value="Service Charges")
+        sheet.cell(row=start + 1, column=6, value="Quantity")
+        sheet.cell(row=start + 2, column=6, value=rng.choice([3, 2.5, "4 nos"]))
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def assert_same_sheet(contents: bytes):
+    streamed = read_quotation_sheet(contents)
+    expected = read_quotation_sheet_pandas(contents)
+
+    assert list(streamed.df.columns) == ["Reference", "Item", "Finishes", "Quantity"]
+    pd.testing.assert_frame_equal(streamed.df, expected.df[list(streamed.df.columns)])
+    assert streamed.project_cell == expected.project_cell
+    assert streamed.service_charge_qty == expected.service_charge_qty
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_matches_pandas_on_random_sheets(seed):
+    assert_same_sheet(make_workbook(seed))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_matches_pandas_with_1904_dates(seed):
+    assert_same_sheet(make_workbook(seed, date1904=True))
+
+
+def test_date_cells_become_datetimes():
+    workbook = openpyxl.Workbook()
+    sheet    = workbook.active
+    for col, name in enumerate(HEADER, start=1):
+        sheet.cell(row=3, column=col, value=name)
+    sheet["B4"] = "R1"
+    sheet["E4"] = datetime(2025, 3, 1, 14, 0)
+    sheet["E4"].number_format = "dd/mm/yyyy hh:mm"
+    sheet["F4"] = 2
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+
+    df = read_quotation_sheet(buffer.getvalue()).df
+    assert df.loc[0, "Finishes"] == pd.Timestamp(2025, 3, 1, 14, 0)
+    assert df.loc[0, "Quantity"] == 2
@@ -0,0 +1,94 @@
+"""
+Workbooks from the streaming xlsx writer, read back with openpyxl: every
+sheet, title and cell must come back as written, with blanks for None, NaN,
+infinities and empty strings, and with control characters dropped.
+"""
+import io
+import math
+import random
+
+import numpy as np
+import openpyxl
+import pytest
+
+from xlsx_writer import iter_xlsx, write_xlsx
+
+COLUMNS = ["Order Lines/Product", "Order Lines/Description", "Cabinet Position",
+           "Order Lines / Quantity"]
+
+
+def read_back(data: bytes, read_only: bool = False) -> dict:
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=read_only)
+    try:
+        sheets = {sheet.title: [list(row) for row in sheet.iter_rows(values_only=True)]
+                  for sheet in workbook.worksheets}
+    finally:
+        workbook.close()
+    # read_only mode leaves out the empty cells at the end of a row
+    for rows in sheets.values():
+        width = max(map(len, rows), default=0)
+        for row in rows:
+            row.extend([None] * (width - len(row)))
+    return sheets
+
+
+def expected_cell(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, str):
+        return "".join(ch for ch in value if ch in "\t\n\r" or ord(ch) >= 32) or None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def expected_rows(columns, rows) -> list:
+    return [list(columns)] + [[expected_cell(v) for v in row] for row in rows]
+
+
+@pytest.mark.parametrize("read_only", [False, True])
+def test_values_round_trip(read_only):
+    rows = [
+        ("EP-22-GVG", "[EP-22-GVG] (Glacier Veil Gloss)", "B1", 2),
+        ("<&>\"'", "  leading and trailing  ", "tab\tinside", 2.5),
+        ("ünïcödé ✓", "line\nbreak", "ctrl\x01\x1fchars", -7),
+        ("big", "ints", None, 2 ** 53),
+        ("floats", "", 1e-7, 0.1 + 0.2),
+        ("not finite", "nan", math.nan, math.inf),
+        ("bools", True, False, None),
+        ("numpy", np.int64(42), np.float64(1.25), np.bool_(True)),
+    ]
+    data = write_xlsx([("Success", COLUMNS, rows)])
+
+    assert read_back(data, read_only)["Success"] == expected_rows(COLUMNS, rows)
+
+
+def test_sheet_order_and_titles():
+    sheets = [
+        ("Success", COLUMNS, [("A", "a", "1", 1)]),
+        ("Failed", ["Row", "Model", "Cabinet Position", "Reason"], []),
+        ('Q&A "quoted" <sheet>', ["Only"], [("x",)]),
+    ]
+    workbook = read_back(write_xlsx(sheets))
+
+    assert list(workbook) == ["Success", "Failed", 'Q&A "quoted" <sheet>']
+    assert workbook["Failed"] == [["Row", "Model", "Cabinet Position", "Reason"]]
+    assert workbook['Q&A "quoted" <sheet>'] == [["Only"], ["x"]]
+
+
+def test_long_sheet_streamed_in_small_chunks():
+    rng  = random.Random(7)
+    rows = [(f"P-{i}", f"Line {i} " + "x" * rng.randint(0, 40), str(rng.randint(1, 9)),
+             rng.choice([rng.randint(1, 50), round(rng.uniform(0, 10), 3)]))
+            for i in range(3000)]
+    chunks = list(iter_xlsx([("Success", COLUMNS, iter(rows))], chunk_size=4096))
+
+    assert len(chunks) > 2
+    assert read_back(b"".join(chunks), read_only=True)["Success"] == expected_rows(COLUMNS, rows)
+
+
+def test_requires_a_sheet():
+    with pytest.raises(ValueError):
+        write_xlsx([])
@@ -0,0 +1,55 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from starlette.concurrency import run_in_threadpool
+
+# Worker processes for the CPU-bound pipeline stages (parsing, row expansion,
+# workbook writing). 0 runs them in the threadpool of the serving process.
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", str(os.cpu_count() or 1)))
+
+_pool = None
+
+
+def get_pool() -> ProcessPoolExecutor | None:
+    global _pool
+    if _pool is None and PIPELINE_WORKERS > 0:
+        # "spawn" so workers never inherit the event loop, DB pool or Odoo sockets
+        _pool = ProcessPoolExecutor(
+            max_workers=PIPELINE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+async def run_cpu_bound(fn, *args, **kwargs):
+    """Run `fn` off the event loop, in the process pool when one is configured."""
+    call = functools.partial(fn, *args, **kwargs)
+    pool = get_pool()
+    if pool is None:
+        return await run_in_threadpool(call)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, call)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed on a huge workbook), which breaks the
+        # whole pool; replace it so only the calls in flight fail
+        _discard_pool(pool)
+        raise
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    global _pool
+    if _pool is pool:
+        print("Worker pool broke, starting a new one for later calls")
+        _pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
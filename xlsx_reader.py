@@ -0,0 +1,430 @@
+"""
+Readers for Infurnia quotation workbooks.
+
+`read_quotation_sheet` streams the sheet XML and decodes only the cells the
+pipeline needs: the project cell (C2), the header row, the requested columns
+plus the column right of "Finishes", and the "Service Charges" block. Every
+other cell is skipped while parsing, so time and memory follow the columns
+used rather than the sheet width. Values are converted the way
+`pd.read_excel` converts them (numbers styled as dates become datetimes,
+as openpyxl makes them), so the result can stand in for the pandas path,
+which `read_quotation_sheet_pandas` keeps as the fallback.
+"""
+import io
+import math
+import os
+import posixpath
+import re
+import zipfile
+from dataclasses import dataclass
+from xml.etree.ElementTree import ParseError, iterparse
+
+import pandas as pd
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, WINDOWS_EPOCH, from_excel, from_ISO8601
+
+# Zero-based row holding the column headers in Infurnia quotation sheets
+HEADER_ROW = 2
+
+# Zero-based (row, column) of the cell that starts with the CRM project ID
+PROJECT_CELL = (1, 2)
+
+REQUIRED_COLUMNS = ("Reference", "Item", "Finishes")
+
+# "stream" tries the streaming reader first; "pandas" always uses read_excel
+XLSX_READER = os.getenv("XLSX_READER", "stream").strip().lower()
+
+_REL_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+
+# pandas' default `na_values`: read_excel turns these strings into NaN
+_NA_STRINGS = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None",
+    "n/a", "nan", "null",
+}
+
+_DIGITS = "0123456789"
+
+# Cell types for numbers whose style formats them as a date or a duration
+_SERIAL_DATE      = "serial-date"
+_SERIAL_TIMEDELTA = "serial-timedelta"
+_NUMBER_TYPES     = {"n", _SERIAL_DATE, _SERIAL_TIMEDELTA}
+
+
+class SheetFormatError(ValueError):
+    """The workbook does not match the layout the streaming reader handles."""
+
+
+@dataclass
+class QuotationSheet:
+    df: pd.DataFrame                  # header-row frame, one row per sheet line below the header
+    project_cell: object              # raw value of C2, None if empty
+    service_charge_qty: float | None  # quantity under "Service Charges", if present
+
+
+# ── Shared helpers ────────────────────────────────────────────────────────────
+
+def header_names(values) -> list:
+    """
+    Column names the way `pd.read_excel(header=...)` builds them: blank
+    headers become "Unnamed: <i>" and repeats get ".1", ".2", ... suffixes.
+    """
+    names, seen = [], {}
+    for i, value in enumerate(values):
+        name = f"Unnamed: {i}" if value is None or pd.isna(value) else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+class _ServiceChargeScan:
+    """
+    Row-by-row search for the service charge quantity: find a "Service
+    Charges" cell, take the "Quantity" column from the next row, and read the
+    number from the row after that. A candidate that yields no number is
+    dropped and the search carries on with later rows.
+    """
+
+    def __init__(self):
+        self.pending = []   # [[label_row, qty_col or None]]
+        self.qty     = None
+
+    def feed(self, row_idx: int, values: dict):
+        for cand in list(self.pending):
+            label_row, qty_col = cand
+            if row_idx == label_row + 1:
+                cand[1] = next(
+                    (c for c in sorted(values) if str(values[c]).strip() == "Quantity"), None
+                )
+                if cand[1] is None:
+                    self.pending.remove(cand)
+            elif row_idx == label_row + 2 and qty_col is not None:
+                self.pending.remove(cand)
+                match = re.search(r"[\d.]+", str(values.get(qty_col)))
+                if match and self.qty is None:
+                    self.qty = float(match.group())
+            else:
+                # The row the candidate needed was empty
+                self.pending.remove(cand)
+
+        if self.qty is None and any(
+            str(v).strip() == "Service Charges" for v in values.values()
+        ):
+            self.pending.append([row_idx, None])
+
+    @property
+    def done(self) -> bool:
+        return self.qty is not None
+
+
+# ── Streaming reader ──────────────────────────────────────────────────────────
+
+def _column_index(letters: str) -> int:
+    idx = 0
+    for ch in letters:
+        idx = idx * 26 + (ord(ch) - 64)
+    return idx - 1
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _resolve_part(target: str) -> str:
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join("xl", target))
+
+
+def _locate_parts(zf: zipfile.ZipFile):
+    """
+    Return (path of the first worksheet, path of the shared strings or None,
+    path of the styles or None, date epoch).
+    """
+    rels = {}
+    with zf.open("xl/_rels/workbook.xml.rels") as f:
+        for _, el in iterparse(f):
+            if _local(el.tag) == "Relationship":
+                rels[el.get("Id")] = (el.get("Type", ""), el.get("Target", ""))
+
+    sheet_path = None
+    epoch      = WINDOWS_EPOCH
+    with zf.open("xl/workbook.xml") as f:
+        for _, el in iterparse(f):
+            name = _local(el.tag)
+            if name == "workbookPr" and el.get("date1904") in ("1", "true"):
+                epoch = CALENDAR_MAC_1904
+            if name != "sheet":
+                continue
+            rel_type, target = rels.get(el.get(_REL_ID), ("", ""))
+            if rel_type.endswith("/worksheet"):
+                sheet_path = _resolve_part(target)
+                break
+    if sheet_path is None:
+        raise SheetFormatError("Workbook has no worksheet")
+
+    def part(suffix):
+        return next((_resolve_part(t) for rel_type, t in rels.values() if rel_type.endswith(suffix)),
+                    None)
+
+    return sheet_path, part("/sharedStrings"), part("/styles"), epoch
+
+
+def _read_shared_strings(zf: zipfile.ZipFile, path: str | None) -> list:
+    if path is None or path not in zf.NameToInfo:
+        return []
+    strings = []
+    with zf.open(path) as f:
+        for _, el in iterparse(f):
+            if _local(el.tag) != "si":
+                continue
+            # Plain <t> plus rich-text runs <r><t>; phonetic hints <rPh> are skipped
+            parts = []
+            for child in el:
+                name = _local(child.tag)
+                if name == "t":
+                    parts.append(child.text or "")
+                elif name == "r":
+                    parts.extend(t.text or "" for t in child if _local(t.tag) == "t")
+            strings.append("".join(parts))
+            el.clear()
+    return strings
+
+
+def _read_date_styles(zf: zipfile.ZipFile, path: str | None) -> dict:
+    """
+    Cell style index -> _SERIAL_DATE or _SERIAL_TIMEDELTA for the styles whose
+    number format shows a date, time or duration, decided as openpyxl does.
+    """
+    if path is None or path not in zf.NameToInfo:
+        return {}
+    custom, formats, in_cell_xfs = {}, [], False
+    with zf.open(path) as f:
+        for event, el in iterparse(f, events=("start", "end")):
+            name = _local(el.tag)
+            if name == "cellXfs":
+                in_cell_xfs = event == "start"
+            elif event == "end" and name == "numFmt":
+                custom[int(el.get("numFmtId"))] = el.get("formatCode", "")
+            elif event == "end" and name == "xf" and in_cell_xfs:
+                formats.append(int(el.get("numFmtId", "0")))
+    styles = {}
+    for index, fmt_id in enumerate(formats):
+        fmt = custom.get(fmt_id, BUILTIN_FORMATS.get(fmt_id))
+        if fmt is not None and is_date_format(fmt):
+            styles[index] = _SERIAL_TIMEDELTA if is_timedelta_format(fmt) else _SERIAL_DATE
+    return styles
+
+
+def _decode(cell_type, text, shared_strings, epoch=WINDOWS_EPOCH):
+    """Convert one raw cell the way read_excel does; None means empty."""
+    if text is None or text == "":
+        return None
+    if cell_type == "n":
+        value = float(text)
+        return int(value) if value.is_integer() else value
+    if cell_type == _SERIAL_DATE or cell_type == _SERIAL_TIMEDELTA:
+        value = float(text)
+        try:
+            return from_excel(int(value) if value.is_integer() else value, epoch,
+                              timedelta=cell_type == _SERIAL_TIMEDELTA)
+        except (OverflowError, ValueError):
+            return None  # openpyxl reads it as #VALUE!, which read_excel makes NaN
+    if cell_type == "d":
+        return from_ISO8601(text)
+    if cell_type == "s":
+        text = shared_strings[int(text)]
+    elif cell_type == "b":
+        return text == "1"
+    elif cell_type == "e":
+        return None
+    # "s", "inlineStr" and "str" (formula result) are strings
+    return None if text in _NA_STRINGS else text
+
+
+def read_quotation_sheet(contents: bytes, columns=REQUIRED_COLUMNS,
+                         quantity_after: str = "Finishes") -> QuotationSheet:
+    """
+    Stream the first worksheet and return the requested columns, the column
+    immediately right of `quantity_after`, C2 and the Service Charges
+    quantity. Raises SheetFormatError if the sheet has an unexpected layout.
+    """
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(contents))
+    except zipfile.BadZipFile as e:
+        raise SheetFormatError(f"Not an xlsx archive: {e}") from e
+
+    with zf:
+        try:
+            sheet_path, strings_path, styles_path, epoch = _locate_parts(zf)
+        except KeyError as e:
+            raise SheetFormatError(f"Missing workbook part: {e}") from e
+        shared_strings = _read_shared_strings(zf, strings_path)
+        date_styles    = _read_date_styles(zf, styles_path)
+
+        project_cell = None
+        wanted       = None    # column index -> frame column name, known after the header row
+        data         = {}      # frame row -> {column index: value}
+        last_row     = -1      # last row with content in any column (read_excel trims after it)
+        max_col      = -1      # widest column with content (read_excel's frame width)
+        scan         = _ServiceChargeScan()
+
+        ns = None
+        row_idx = -1
+        cells = []             # (column index, type, raw text) of the current row
+        next_col = 0
+        col_cache = {}         # "AB" -> 27
+
+        with zf.open(sheet_path) as f:
+            for _, el in iterparse(f):
+                if ns is None:
+                    ns = el.tag[: el.tag.find("}") + 1]
+                    c_tag, row_tag, v_tag = f"{ns}c", f"{ns}row", f"{ns}v"
+                    is_tag, data_tag = f"{ns}is", f"{ns}sheetData"
+                tag = el.tag
+
+                if tag == c_tag:
+                    ref = el.get("r")
+                    if ref:
+                        letters = ref.rstrip(_DIGITS)
+                        col_idx = col_cache.get(letters)
+                        if col_idx is None:
+                            col_idx = col_cache[letters] = _column_index(letters)
+                    else:
+                        col_idx = next_col
+                    next_col = col_idx + 1
+                    cell_type = el.get("t", "n")
+                    if cell_type == "n" and date_styles:
+                        cell_type = date_styles.get(int(el.get("s", "0")), "n")
+                    if cell_type == "inlineStr":
+                        node = el.find(is_tag)
+                        text = "".join(node.itertext()) if node is not None else None
+                    else:
+                        text = el.findtext(v_tag)
+                    if text:
+                        cells.append((col_idx, cell_type, text))
+                    el.clear()
+                    continue
+
+                if tag != row_tag:
+                    if tag == data_tag:
+                        break
+                    continue
+
+                # ── End of one <row> ──────────────────────────────────────────
+                r = el.get("r")
+                row_idx = int(r) - 1 if r else row_idx + 1
+                el.clear()
+                row_cells, cells, next_col = cells, [], 0
+                if not row_cells:
+                    continue
+
+                if row_idx <= HEADER_ROW or scan.pending:
+                    values = {c: _decode(t, x, shared_strings, epoch) for c, t, x in row_cells}
+                else:
+                    # Decode strings for the Service Charges search and the
+                    # wanted columns; skip every other number unread.
+                    values = {
+                        c: _decode(t, x, shared_strings, epoch)
+                        for c, t, x in row_cells
+                        if t not in _NUMBER_TYPES or (wanted is not None and c in wanted)
+                    }
+                values = {c: v for c, v in values.items() if v is not None}
+
+                if any(t != "s" or shared_strings[int(x)] != "" for _, t, x in row_cells):
+                    last_row = row_idx
+                    max_col  = max(max_col, row_cells[-1][0])
+
+                if row_idx == PROJECT_CELL[0]:
+                    project_cell = values.get(PROJECT_CELL[1])
+                elif row_idx == HEADER_ROW:
+                    wanted = _wanted_columns(values, columns, quantity_after)
+                elif row_idx > HEADER_ROW and wanted is not None:
+                    picked = {c: values[c] for c in wanted if c in values}
+                    if picked:
+                        data[row_idx - HEADER_ROW - 1] = picked
+
+                if not scan.done:
+                    scan.feed(row_idx, values)
+
+    if wanted is None:
+        raise SheetFormatError(f"Sheet has no header row at line {HEADER_ROW + 1}")
+    if max(wanted) > max_col:
+        raise SheetFormatError("Column right of 'Finishes' is outside the sheet")
+
+    n_rows = max(last_row - HEADER_ROW, 0)
+    frame = {}
+    for col_idx in sorted(wanted):
+        column = [math.nan] * n_rows  # read_excel leaves empty cells NaN
+        for row, picked in data.items():
+            if row < n_rows and col_idx in picked:
+                column[row] = picked[col_idx]
+        frame[wanted[col_idx]] = column
+
+    df = pd.DataFrame(frame, dtype=object).infer_objects()
+    return QuotationSheet(df, project_cell, scan.qty)
+
+
+def _wanted_columns(header_values: dict, columns, quantity_after: str) -> dict:
+    width = max(header_values) + 1 if header_values else 0
+    names = header_names([header_values.get(i) for i in range(width)])
+
+    wanted = {}
+    for name in columns:
+        idx = next((i for i, n in enumerate(names) if str(n).strip() == name), None)
+        if idx is None:
+            raise SheetFormatError(f"Missing column in sheet: {name}")
+        wanted[idx] = names[idx]
+
+    anchor = next(i for i, n in wanted.items() if str(n).strip() == quantity_after)
+    wanted[anchor + 1] = names[anchor + 1] if anchor + 1 < width else f"Unnamed: {anchor + 1}"
+    return wanted
+
+
+# ── pandas reader (fallback) ──────────────────────────────────────────────────
+
+def frame_from_header_row(raw_df: pd.DataFrame, header_row: int = HEADER_ROW) -> pd.DataFrame:
+    """
+    Build the frame `pd.read_excel(header=header_row)` would return, from a
+    sheet already parsed with `header=None` — so the workbook is only parsed once.
+    """
+    if len(raw_df) <= header_row:
+        raise ValueError(f"Sheet has no header row at line {header_row + 1}")
+
+    df = raw_df.iloc[header_row + 1:].reset_index(drop=True)
+    df.columns = header_names(raw_df.iloc[header_row])
+    return df.infer_objects()
+
+
+def read_quotation_sheet_pandas(contents: bytes) -> QuotationSheet:
+    # Parse once; the header-row frame, project ID and service charges
+    # are all derived from this single read.
+    raw_df = pd.read_excel(io.BytesIO(contents), sheet_name=0, header=None, engine="openpyxl")
+    df     = frame_from_header_row(raw_df)
+
+    row, col = PROJECT_CELL
+    project_cell = None
+    if row < raw_df.shape[0] and col < raw_df.shape[1] and not pd.isna(raw_df.iat[row, col]):
+        project_cell = raw_df.iat[row, col]
+
+    scan = _ServiceChargeScan()
+    for i, raw_row in enumerate(raw_df.itertuples(index=False)):
+        scan.feed(i, {j: v for j, v in enumerate(raw_row) if not pd.isna(v)})
+        if scan.done:
+            break
+
+    return QuotationSheet(df, project_cell, scan.qty)
+
+
+def load_quotation_sheet(contents: bytes) -> QuotationSheet:
+    """Streaming reader when possible, pandas when the sheet is outside its layout."""
+    if XLSX_READER == "stream":
+        try:
+            return read_quotation_sheet(contents)
+        except (SheetFormatError, ParseError, KeyError, ValueError, IndexError) as e:
+            print(f"Streaming reader fell back to pandas: {e}")
+    return read_quotation_sheet_pandas(contents)
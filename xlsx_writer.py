@@ -0,0 +1,192 @@
+"""
+Streaming writer for plain-table xlsx workbooks.
+
+`iter_xlsx` yields the zip file in chunks while rows are still being
+serialized, so a response can start before the last row is written and
+memory stays flat however long the sheets are. Strings are written inline
+(no shared-strings table, which would need every string up front) and the
+zip is written with data descriptors, so nothing is ever seeked back to.
+"""
+import io
+import math
+import numbers
+import re
+import zipfile
+from itertools import chain
+from xml.sax.saxutils import escape, quoteattr
+
+# Flush to the caller once this much compressed output has built up (bytes)
+CHUNK_SIZE = 64 * 1024
+
+# Rows serialized per write into the zip entry
+_ROWS_PER_PIECE = 256
+
+# Control characters are not allowed anywhere in SpreadsheetML
+_ILLEGAL_XML_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_XML_HEAD = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_MAIN_NS  = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS   = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PKG_NS   = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_STYLES = (
+    _XML_HEAD
+    + f'<styleSheet xmlns="{_MAIN_NS}">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    "</styleSheet>"
+)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write target for ZipFile that hands out whatever has been written so far."""
+
+    def __init__(self):
+        self._chunks = []
+        self.pending = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.pending += len(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.pending = 0
+        return data
+
+
+def _column_letters(n: int) -> list:
+    letters = []
+    for i in range(1, n + 1):
+        name = ""
+        while i:
+            i, rem = divmod(i - 1, 26)
+            name = chr(65 + rem) + name
+        letters.append(name)
+    return letters
+
+
+def _cell(ref: str, value) -> str:
+    """One <c> element; empty string for cells left blank (None, NaN, "")."""
+    kind = type(value)
+    if value is None:
+        return ""
+    if kind is str:
+        if not value:
+            return ""
+        text  = escape(_ILLEGAL_XML_RE.sub("", value))
+        space = ' xml:space="preserve"' if value[0].isspace() or value[-1].isspace() else ""
+        return f'<c r="{ref}" t="inlineStr"><is><t{space}>{text}</t></is></c>'
+    if kind is bool or getattr(value, "dtype", None) == bool:  # numpy.bool_ as well
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Integral):
+        return f'<c r="{ref}"><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if not math.isfinite(value):
+            return ""
+        text = repr(value)
+        if text.endswith(".0"):
+            text = text[:-2]
+        return f'<c r="{ref}"><v>{text}</v></c>'
+    return _cell(ref, str(value))
+
+
+def _sheet_parts(columns, rows):
+    """The worksheet XML, a few hundred rows per piece."""
+    letters = _column_letters(len(columns))
+    yield _XML_HEAD + f'<worksheet xmlns="{_MAIN_NS}"><sheetData>'
+
+    parts = []
+    for row_no, row in enumerate(chain([columns], rows), start=1):
+        cells = "".join(_cell(f"{letter}{row_no}", value) for letter, value in zip(letters, row))
+        parts.append(f'<row r="{row_no}">{cells}</row>')
+        if len(parts) == _ROWS_PER_PIECE:
+            yield "".join(parts)
+            parts.clear()
+    parts.append("</sheetData></worksheet>")
+    yield "".join(parts)
+
+
+def _workbook_parts(titles) -> dict:
+    sheets = "".join(
+        f'<sheet name={quoteattr(title)} sheetId="{i}" r:id="rId{i}"/>'
+        for i, title in enumerate(titles, start=1)
+    )
+    sheet_rels = "".join(
+        f'<Relationship Id="rId{i}" Type="{_REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+        for i in range(1, len(titles) + 1)
+    )
+    sheet_types = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType='
+        '"application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for i in range(1, len(titles) + 1)
+    )
+    n = len(titles)
+    return {
+        "[Content_Types].xml": (
+            _XML_HEAD
+            + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType='
+            '"application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" ContentType='
+            '"application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            + sheet_types + "</Types>"
+        ),
+        "_rels/.rels": (
+            _XML_HEAD
+            + f'<Relationships xmlns="{_PKG_NS}">'
+            f'<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+            "</Relationships>"
+        ),
+        "xl/workbook.xml": (
+            _XML_HEAD
+            + f'<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}"><sheets>{sheets}</sheets></workbook>'
+        ),
+        "xl/_rels/workbook.xml.rels": (
+            _XML_HEAD
+            + f'<Relationships xmlns="{_PKG_NS}">{sheet_rels}'
+            f'<Relationship Id="rId{n + 1}" Type="{_REL_NS}/styles" Target="styles.xml"/>'
+            "</Relationships>"
+        ),
+        "xl/styles.xml": _STYLES,
+    }
+
+
+def iter_xlsx(sheets, chunk_size: int = CHUNK_SIZE):
+    """
+    Yield an xlsx file as byte chunks. `sheets` is a list of
+    (title, columns, rows) with `rows` any iterable of value tuples.
+    """
+    if not sheets:
+        raise ValueError("At least one sheet is required")
+
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, xml in _workbook_parts([title for title, _, _ in sheets]).items():
+            archive.writestr(name, xml)
+
+        for i, (_, columns, rows) in enumerate(sheets, start=1):
+            with archive.open(f"xl/worksheets/sheet{i}.xml", "w") as part:
+                for piece in _sheet_parts(columns, rows):
+                    part.write(piece.encode("utf-8"))
+                    if sink.pending >= chunk_size:
+                        yield sink.drain()
+    yield sink.drain()
+
+
+def write_xlsx(sheets) -> bytes:
+    """`iter_xlsx` collected into one bytes object."""
+    return b"".join(iter_xlsx(sheets))